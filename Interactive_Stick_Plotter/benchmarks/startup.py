@@ -0,0 +1,47 @@
+"""Startup benchmark for cmdGraph.
+
+Measures the time from launching a new Python process to the cmdGraph prompt
+being ready for input, and to the first figure being created. Run from the
+Interactive_Stick_Plotter directory:
+
+    python benchmarks/startup.py [repeats]
+"""
+import os
+import subprocess
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+
+to_prompt = """
+from cmdGraph.cmg import prompt
+prompt.cmgPrompt(mode='launch')
+"""
+
+to_figure = """
+import matplotlib
+matplotlib.use('Agg')
+from cmdGraph.cmg import prompt
+import matplotlib.pyplot as plt
+plt.rc = lambda *args, **kwargs: None #latex is not needed to time the figure
+prompt.cmgPrompt(mode='launch')._View
+"""
+
+def time_process(code, repeats):
+    """Median wall time of running code in a fresh interpreter."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=root, check=True)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times)//2]
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    bare = time_process("pass", repeats)
+    prompt = time_process(to_prompt, repeats)
+    figure = time_process(to_figure, repeats)
+    print("python interpreter : {:6.3f} s".format(bare))
+    print("time to prompt     : {:6.3f} s".format(prompt))
+    print("time to figure     : {:6.3f} s".format(figure))
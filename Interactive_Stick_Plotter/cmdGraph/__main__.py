@@ -1,3 +1,5 @@
+import argparse
+
 from cmdGraph.cmg import prompt
 
 welcome_message = """
@@ -26,5 +28,20 @@ welcome_message = """
 """
 
 if __name__ == "__main__":
-    print(welcome_message) #print welcome message
-    prompt.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(prog="python -m cmdGraph",
+        description="Interactive command-based plotter. Give '.cmg' save files "
+        "to print them without opening the prompt.")
+    parser.add_argument('cmgFiles', nargs='*', metavar='file.cmg',
+        help="save files to render in batch mode")
+    parser.add_argument('-o', '--outdir', default=None,
+        help="directory for printed figures (default: next to each save file)")
+    parser.add_argument('-t', '--type', default='pdf',
+        help="file type of printed figures, e.g 'pdf', 'png'")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help="number of worker processes (default: number of cores)")
+    args = parser.parse_args()
+    if args.cmgFiles:
+        prompt.batch(args.cmgFiles, outDir=args.outdir, fileType=args.type, nWorkers=args.jobs)
+    else:
+        print(welcome_message) #print welcome message
+        prompt.run()
\ No newline at end of file
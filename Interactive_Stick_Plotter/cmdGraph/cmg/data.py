@@ -1,50 +1,300 @@
-import cmd #for program commands
-import argparse #for figure arguments
 import numpy as np #for... need I explain?
-import matplotlib #urm... seems kinda obvious
-import matplotlib.pyplot as plt #convenience
 import sys
-import pandas as pd
+import os
+import io
+import json
+import mmap
+import copy
+import hashlib
+import re
+
+from .misc import LazyModule
+
+pd = LazyModule('pandas') #imported when a file is first parsed
 
 _small_ = 1e-300
 
+# Persistent cache of parsed data files, see read_data. Set CMDGRAPH_CACHE_MB=0
+# to switch the cache off.
+_cacheDir = os.environ.get('CMDGRAPH_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'cmdGraph'))
+_cacheLimit = float(os.environ.get('CMDGRAPH_CACHE_MB', 1024))*2**20 #bytes
+_cacheVersion = 1 #increase when the arrays stored by any _to_cache change
+
 ### Data Classes 
 
 class _Data:
+    _readsInteractively = False #True if reading asks the user for input
+    _cacheable = False #True if the class defines _to_cache and _from_cache, see _read_cached
+    _nCols = None #number of numeric columns, set by classes that can be followed
+    _windowed = False #True if read_file can read only a wavenumber window
+    window = None #(min, max) wavenumber window to read, see read_data
     def __init__(self, filename):
         self.fName = filename
         self.dat = None
 
+    @classmethod
+    def _sniff(cls, fName, head):
+        """Return True if the file, whose first bytes are head, is in the
+        format of this class. See detect_filetype."""
+        return False
+
+    def _sources(self):
+        """The files the data is read from."""
+        return [self.fName]
+
+    def follow(self):
+        """Parse the complete lines written to the file since the last call,
+        the first call reading the file from the beginning, and add them to
+        the data with _append_rows, which classes that can be followed define.
+        Only the new bytes are read, so a file that is still being written can
+        be followed cheaply. Lines that are not numbers are skipped with a
+        warning. If the file has shrunk, e.g because it was overwritten, it is
+        read again from the start. The data is empty, rather than None, after
+        the first call.
+
+        Returns the array of new rows, or None if nothing has changed.
+        """
+        offset = getattr(self, '_offset', 0)
+        size = os.path.getsize(self.fName)
+        replaced = size < offset
+        if replaced: #start again
+            offset = 0
+            self.dat = None
+        if self.dat is None:
+            self._append_rows(np.empty((0, self._nCols)))
+        chunk = b''
+        if size > offset:
+            with open(self.fName, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read(size - offset)
+            chunk = chunk[:chunk.rfind(b'\n') + 1] #last line may still be being written
+        self._offset = offset + len(chunk)
+        if not chunk.strip():
+            return np.empty((0, self._nCols)) if replaced else None
+        try:
+            rows = _read_columns(io.BytesIO(chunk), self._nCols)
+            if np.isnan(rows).any(): #short line
+                raise ValueError
+        except ValueError: #a line that is not numbers, parse line by line
+            rows = self._read_good_lines(chunk)
+        self._append_rows(rows)
+        return rows
+
+    def _read_good_lines(self, chunk):
+        """Parse the lines of chunk one at a time, skipping with a warning the
+        lines that do not start with _nCols numbers."""
+        rows = []
+        for line in chunk.splitlines():
+            tokens = line.split()[:self._nCols]
+            if not tokens:
+                continue
+            try:
+                if len(tokens) < self._nCols:
+                    raise ValueError
+                rows.append([float(token) for token in tokens])
+            except ValueError:
+                print("Skipped line '{}' of '{}'.".format(line.decode(errors='replace'), self.fName))
+        return np.array(rows, dtype=float).reshape(-1, self._nCols)
+
+def _read_columns(fName, nCols):
+    """Read a whitespace delimited file, or file object, of nCols numeric
+    columns straight into a float array of shape (n, nCols) using the pandas C
+    parser."""
+    return pd.read_csv(fName, sep=r'\s+', header=None, usecols=range(nCols),
+        dtype=float, engine='c', float_precision='round_trip',
+        skip_blank_lines=True).to_numpy()
+
 class xyData(_Data):
     """Data format for two column x, y data files where each row is a data point.
     assumes no column headers. Currently just a skeleton class for basic operation."""
+    @classmethod
+    def _sniff(cls, fName, head):
+        tokens = _first_tokens(head)
+        return fName.endswith('.csv') or (len(tokens) == 2 and all(_is_number(t) for t in tokens))
+
     def read_file(self):
         """Read x, y columns from file"""
-        with open(self.fName, 'r') as f:
-            datLines = []
-            for l in f:
-                line = l.strip().split()
-                datLines.append(line)
-            self.dat = np.array(datLines, dtype=float).T
+        self.dat = _read_columns(self.fName, 2).T
+        self.isSorted = bool((np.diff(self.dat[0]) >= 0).all()) #spectra usually are
         return self
 
+    _cacheable = True
+    def _to_cache(self):
+        return {'dat': self.dat, 'isSorted': np.array(self.isSorted)}
+
+    def _from_cache(self, arrays):
+        self.dat = arrays['dat']
+        self.isSorted = bool(arrays['isSorted'])
+
+    _nCols = 2
+    def _append_rows(self, rows):
+        """Append new points to the end of the data, which stays sorted only
+        if the new points continue the x order."""
+        if self.dat is None:
+            self.dat = np.empty((2, 0))
+            self.isSorted = True
+        x = rows[:, 0]
+        self.isSorted = bool(self.isSorted and (np.diff(x) >= 0).all()
+            and (not len(x) or not self.dat.shape[1] or x[0] >= self.dat[0, -1]))
+        self.dat = np.concatenate([self.dat, rows.T], axis=1)
+
+    def find_peaks(self, nSigma=5., minSeparation=0., fName=None):
+        """Return the peaks of the spectrum as stick data, see find_peaks."""
+        x, y = self.dat
+        if not self.isSorted:
+            order = np.argsort(x, kind='stable')
+            x, y = x[order], y[order]
+        sticks = stickData(fName or self.fName)
+        sticks._set_sticks(*find_peaks(x, y, nSigma, minSeparation))
+        return sticks
+
+def find_peaks(x, y, nSigma=5., minSeparation=0., chunkSize=10**6):
+    """Find the peaks of a spectrum y(x), sorted in x, that stand more than
+    nSigma times the noise above the baseline and whose prominence is more than
+    nSigma times the noise. The prominence of a peak is its height above the
+    deeper of the dips separating it from higher peaks on either side, so noise
+    on the sides of a line, which only dips a little below the top of the line,
+    is not taken for peaks however finely the line is sampled. Of peaks closer
+    than minSeparation, in x units, only the highest is kept, which can be used
+    to merge lines with flat or split tops. Returns the positions and heights of
+    the peaks.
+
+    Local maxima above the threshold are found in chunks of chunkSize points
+    with numpy comparisons. The baseline and noise of each chunk are its median
+    and the scaled median absolute deviation from it, which are not pulled up by
+    the peaks themselves. The dips between neighbouring maxima are found with a
+    minimum.reduceat, and maxima that are lower than a neighbour across a
+    shallow dip are removed until none are left."""
+    peaks, minProminence = [], []
+    for start in range(0, len(y), chunkSize):
+        stop = min(start + chunkSize, len(y))
+        chunk = y[start:stop]
+        baseline = np.median(chunk)
+        noise = 1.4826*np.median(np.abs(chunk - baseline))
+        before = y[start-1:stop-1] if start else np.r_[-np.inf, chunk[:-1]]
+        after = np.r_[chunk[1:], y[stop] if stop < len(y) else -np.inf]
+        idx = np.flatnonzero((chunk > before) & (chunk >= after) & (chunk > baseline + nSigma*noise))
+        peaks.append(idx + start)
+        minProminence.append(np.full(len(idx), nSigma*noise))
+    peaks = np.concatenate(peaks) if peaks else np.array([], dtype=int)
+    minProminence = np.concatenate(minProminence) if peaks.size else np.array([])
+    dips = np.minimum.reduceat(y, peaks)[:-1] if len(peaks) > 1 else np.array([]) #between neighbours
+    while len(peaks) > 1:
+        heights = y[peaks]
+        shallow = np.zeros(len(peaks), dtype=bool)
+        shallow[:-1] |= (heights[1:] > heights[:-1]) & (heights[:-1] - dips < minProminence[:-1])
+        shallow[1:] |= (heights[:-1] >= heights[1:]) & (heights[1:] - dips < minProminence[1:])
+        if not shallow.any():
+            break
+        kept = np.flatnonzero(~shallow)
+        dips = np.minimum.reduceat(dips[:kept[-1]], kept[:-1]) if len(kept) > 1 else np.array([])
+        peaks, minProminence = peaks[kept], minProminence[kept]
+    while minSeparation > 0 and len(peaks) > 1:
+        heights = y[peaks]
+        close = np.diff(x[peaks]) < minSeparation
+        lower = np.zeros(len(peaks), dtype=bool)
+        lower[:-1] |= close & (heights[1:] > heights[:-1])
+        lower[1:] |= close & (heights[:-1] >= heights[1:])
+        if not lower.any():
+            break
+        peaks = peaks[~lower]
+    return x[peaks], y[peaks]
+
 class stickData(_Data):
     """Data format for stick spectra. Input file with two columns of x positions and
     stick height is converted into a set of lines for matplotlib LineCollection."""
+    labels = None #dataframe of quantum number labels for each stick, if known
+    @classmethod
+    def _sniff(cls, fName, head):
+        return fName.endswith('.stick')
+
     def read_file(self):
         """Read wavenumber, intensity columns from file"""
-        with open(self.fName, 'r') as f:
-            datLines = []
-            ymin = ymax = 0
-            for l in f:
-                x, y = l.strip().split()
-                datLines.append([[x, _small_], [x, y]])
-                ymin = float(y) if (float(y) < ymin) else ymin
-                ymax = float(y) if (float(y) > ymax) else ymax
-            self.dat = np.array(datLines, dtype=float)
-            self.ybounds = [float(ymin), (ymax)]
+        x, y = _read_columns(self.fName, 2).T
+        self._set_sticks(x, y)
         return self
 
+    _cacheable = True
+    def _to_cache(self):
+        arrays = {'dat': self.dat, 'ybounds': np.array(self.ybounds),
+            'isSorted': np.array(self.isSorted)}
+        if self.labels is not None:
+            for column in self.labels.columns:
+                values = self.labels[column].to_numpy()
+                arrays['label:' + column] = values.astype(str) if values.dtype == object else values
+        return arrays
+
+    def _from_cache(self, arrays):
+        self.dat = arrays['dat']
+        self.ybounds = arrays['ybounds'].tolist()
+        self.isSorted = bool(arrays['isSorted'])
+        labels = {key[len('label:'):]: value for key, value in arrays.items() if key.startswith('label:')}
+        if labels:
+            self.labels = pd.DataFrame(labels)
+
+    def sort(self):
+        """Sort the sticks by increasing x position, in place. Plots rely on the
+        sorted order to find the sticks in a given x range."""
+        if not getattr(self, 'isSorted', False):
+            order = np.argsort(self.dat[:, 1, 0], kind='stable')
+            self.dat = self.dat[order]
+            if self.labels is not None:
+                self.labels = self.labels.iloc[order].reset_index(drop=True)
+            self.isSorted = True
+        return self
+
+    def _set_sticks(self, x, y):
+        """Build the (n, 2, 2) array of stick segments from stick positions and
+        heights, each stick running from (x, _small_) to (x, y)."""
+        self.dat = np.empty((len(x), 2, 2))
+        self.dat[:, :, 0] = x[:, None]
+        self.dat[:, 0, 1] = _small_
+        self.dat[:, 1, 1] = y
+        self.ybounds = [float(y.min(initial=0.)), float(y.max(initial=0.))]
+        self.isSorted = False
+
+    _nCols = 2
+    def _append_rows(self, rows):
+        """Add new sticks to the data. The sticks are held in a buffer with
+        spare capacity, self.dat being a view of the used part, so only the
+        segments of the new sticks are built. If the sticks are sorted, new
+        sticks beyond the last one are simply appended, otherwise only the
+        sticks after the first new one are moved to merge them in."""
+        if self.dat is None:
+            self._set_sticks(rows[:, 0], rows[:, 1])
+            self.sort()
+            return
+        n, k = len(self.dat), len(rows)
+        buffer = getattr(self, '_buffer', None)
+        if buffer is None or self.dat.base is not buffer or len(buffer) < n + k:
+            buffer = np.empty((max(2*(n + k), 1024), 2, 2))
+            buffer[:n] = self.dat
+            self._buffer = buffer
+        x, y = rows[:, 0], rows[:, 1]
+        if self.isSorted:
+            order = np.argsort(x, kind='stable')
+            x, y = x[order], y[order]
+        new = np.empty((k, 2, 2))
+        new[:, :, 0] = x[:, None]
+        new[:, 0, 1] = _small_
+        new[:, 1, 1] = y
+        self.ybounds = [min(self.ybounds[0], float(y.min(initial=0.))),
+            max(self.ybounds[1], float(y.max(initial=0.)))]
+        start = n
+        if self.isSorted and k:
+            start = np.searchsorted(buffer[:n, 1, 0], x[0], side='right')
+        if start == n:
+            buffer[n:n + k] = new
+        else: #merge the new sticks into the moved tail
+            tail = buffer[start:n].copy()
+            place = np.searchsorted(tail[:, 1, 0], x, side='right') + np.arange(k)
+            isNew = np.zeros(len(tail) + k, dtype=bool)
+            isNew[place] = True
+            buffer[start:n + k][isNew] = new
+            buffer[start:n + k][~isNew] = tail
+        self.dat = buffer[:n + k]
+
 class cmgData(_Data):
     """Data format for internal cmdGraph data files. This allows configurations
     to be saved so that they can be transferred and reloaded after the program
@@ -67,6 +317,10 @@ class cmgData(_Data):
     | --linecolour red
 
     """
+    @classmethod
+    def _sniff(cls, fName, head):
+        return head.lstrip().startswith(b'---cmdGraph---')
+
     def write_file(self, view):
         """Write the View instance to a '.cmg' file with provided name. 
         
@@ -80,16 +334,30 @@ class cmgData(_Data):
         f = open(self.fName, 'w')
         f.write("---cmdGraph---" + '\n')
         f.write("mode " + view.mode + '\n')
-        f.write(("adat " + " {}"*len(view.plots)
-            + '\n').format(*[P._Data.fName for P in view.plots]))
+        if any(P._Data.window is not None for P in view.plots):
+            for P in view.plots: #one file per line, to keep its window
+                window = "--window {} {} ".format(*P._Data.window) if P._Data.window else ''
+                f.write("adat " + window + P._Data.fName + '\n')
+        else:
+            f.write(("adat " + " {}"*len(view.plots)
+                + '\n').format(*[P._Data.fName for P in view.plots]))
         _plotArgs = []
-        for argName in view.argNames:
-            try:
-                argVal = getattr(view, '_prop_' + argName)
-                argVal = str(argVal) if (type(argVal) is not str) else argVal
-                f.write('--' + argName + ' ' + argVal + '\n')
-            except:
-                _plotArgs.append(argName)
+        nPanels = getattr(view, 'nPanels', 1) #axes arguments of each panel
+        selected = getattr(view, '_panel', 0)
+        for panel in range(nPanels):
+            if nPanels > 1:
+                view._set_panel([panel + 1])
+                f.write('--panel {}\n'.format(panel + 1))
+            for argName in view.argNames:
+                try:
+                    argVal = getattr(view, '_prop_' + argName)
+                    argVal = str(argVal) if (type(argVal) is not str) else argVal
+                    f.write('--' + argName + ' ' + argVal + '\n')
+                except:
+                    if argName not in _plotArgs:
+                        _plotArgs.append(argName)
+        if nPanels > 1:
+            view._set_panel([selected + 1])
         for plot in view.plots:
             f.write('single ' + plot._Data.fName + '\n')
             for argName in _plotArgs:
@@ -129,57 +397,171 @@ class cmgData(_Data):
 class duoOutData(_Data):
     """Data format for reading transition data from Duo '.out' files. Automatically
     locates and extracts the transitions data from the Einstein coefficients and
-    linestrengths section of the output file. Returns a numpy array of relevant values."""
+    linestrengths section of the output file. Returns a pandas dataframe of typed
+    columns.
+
+    The file is memory mapped and the block found with a byte search, and the
+    byte offsets of the block are stored in a sidecar '<file>.cmgidx' file so
+    that reloading an unchanged file skips the search."""
+    header = b"    J Gamma <-   J  Gamma Typ       Ei     <-      Ef          nu_if        S(f<-i)          A(if)            I(f<-i)       State v lambda sigma  omega <- State v lambda sigma  omega "
+    cols = [
+        'rotational_final',
+        'gamma_final',
+        'rotational_initial',
+        'gamma_initial',
+        'transition_branch',
+        'energy_final_cm',
+        'energy_initial_cm',
+        'wavenumber',
+        'linestrength_S',
+        'einstein_A',
+        'intensity_I',
+        'electronic_final',
+        'vibrational_final',
+        'lambda_final',
+        'sigma_final',
+        'omega_final',
+        'electronic_initial',
+        'vibrational_initial',
+        'lambda_initial',
+        'sigma_initial',
+        'omega_initial'
+        ]
+    typedict = {key: float for key in cols}
+    typedict.update({'gamma_initial': str, 'gamma_final': str, 'transition_branch': str})
+    # Columns that label a transition, rather than measure it
+    labelCols = [column for column in cols if column not in ['energy_final_cm',
+        'energy_initial_cm', 'wavenumber', 'linestrength_S', 'einstein_A', 'intensity_I']]
+    @classmethod
+    def _sniff(cls, fName, head):
+        return fName.endswith('.out') #the transition block is far from the start
+
+    # Position of each column among the whitespace separated tokens of a line,
+    # the other tokens being the '<-', '(' and ')' separators
+    _tokenCols = [0, 1, 3, 4, 5, 6, 8, 9, 10, 11, 12, 14, 15, 16, 17, 18, 22, 23, 24, 25, 26]
+    _chunkBytes = 16*2**20 #bytes of the block parsed at once, parsing needs several times this
     def read_file(self):
-        """Read linelist from Duo output file."""
-        header = "    J Gamma <-   J  Gamma Typ       Ei     <-      Ef          nu_if        S(f<-i)          A(if)            I(f<-i)       State v lambda sigma  omega <- State v lambda sigma  omega "
-        with open(self.fName, 'r') as f:
-            datLines = []
-            atBlock = False
-            l = 0
-            while True:
-                l += 1
-                line = f.readline().rstrip('\n')
-                if line == header:
-                    atBlock = True
-                    continue
-                if atBlock and line:
-                    if line == "done":
-                        break
-                    line = line.replace('<-', '').replace('(', '').replace(')', '')
-                    datLines.append(
-                        line.replace('<-', '').replace('(', '').replace(')', '').split()
-                        ) #remove non-data columns
-        self.dat = np.array(datLines)
-        self.cols = [
-            'rotational_final',
-            'gamma_final',
-            'rotational_initial',
-            'gamma_initial',
-            'transition_branch',
-            'energy_final_cm',
-            'energy_initial_cm',
-            'wavenumber',
-            'linestrength_S',
-            'einstein_A',
-            'intensity_I',
-            'electronic_final',
-            'vibrational_final',
-            'lambda_final',
-            'sigma_final',
-            'omega_final',
-            'electronic_initial',
-            'vibrational_initial',
-            'lambda_initial',
-            'sigma_initial',
-            'omega_initial'
-            ]
-        self.typedict = {key: float for key in self.cols}
-        self.typedict.update({'gamma_initial': str, 'gamma_final': str, 'transition_branch': str})
+        """Read linelist from Duo output file. The transition block is parsed in
+        chunks of whole lines straight from the memory mapped file, so the
+        whole block is never copied."""
+        stat = os.stat(self.fName)
+        if stat.st_size == 0:
+            print("Transition block not found in '{}'.".format(self.fName))
+            self.dat = self._read_chunk(b'')
+            return self
+        frames = []
+        with open(self.fName, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offsets = self._transition_block(mm, stat)
+            if offsets is None:
+                print("Transition block not found in '{}'.".format(self.fName))
+                offsets = (0, 0)
+            start, stop = offsets
+            while start < stop or not frames:
+                end = min(start + self._chunkBytes, stop)
+                if end < stop: #end the chunk with a whole line
+                    end = mm.find(b'\n', end - 1, stop) + 1 or stop
+                frames.append(self._read_chunk(mm[start:end]))
+                start = end
+        self.dat = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
         return self
 
+    def _read_chunk(self, chunk):
+        """Parse a chunk of whole lines of the transition block. If every line
+        has the '<-', '(' and ')' separators as tokens of their own, their
+        columns are skipped by the parser, otherwise they are removed first."""
+        nLines = chunk.count(b'\n') + (not chunk.endswith(b'\n'))
+        if chunk and chunk.count(b' <- ') == 3*nLines and chunk.count(b' ( ') == 2*nLines \
+                and chunk.count(b' )') == 2*nLines:
+            dat = pd.read_csv(io.BytesIO(chunk), sep=r'\s+', header=None,
+                usecols=self._tokenCols, dtype={token: self.typedict[column]
+                    for token, column in zip(self._tokenCols, self.cols)},
+                engine='c', float_precision='round_trip', skip_blank_lines=True)
+            dat.columns = self.cols
+            return dat
+        chunk = chunk.replace(b'<-', b'  ').translate(None, b'()') #remove non-data columns
+        return pd.read_csv(io.BytesIO(chunk), sep=r'\s+', header=None,
+            names=self.cols, dtype=self.typedict, engine='c',
+            float_precision='round_trip', skip_blank_lines=True)
+
+    def _transition_block(self, mm, stat):
+        """Byte offsets of the transition block in the memory mapped file, from
+        the line after the header up to the 'done' line or the end of file, or
+        None if the file has no transition block."""
+        offsets = self._read_index(stat)
+        if offsets is None:
+            offsets = self._find_block(mm)
+            if offsets is None:
+                return None
+            self._write_index(stat, offsets)
+        return offsets
+
+    def _find_block(self, mm):
+        """Byte offsets of the transition block in the memory mapped file."""
+        pos = -1
+        while True: #find header occupying a whole line
+            pos = mm.find(self.header, pos + 1)
+            if pos == -1:
+                return None
+            end = pos + len(self.header)
+            if (pos == 0 or mm[pos-1:pos] == b'\n') and mm[end:end+1] in [b'\n', b'']:
+                break
+        start = end + 1
+        pos = start - 2
+        while True: #find 'done' occupying a whole line
+            pos = mm.find(b'\ndone', pos + 1)
+            if pos == -1:
+                return start, len(mm)
+            if mm[pos+5:pos+6] in [b'\n', b'']:
+                return start, pos + 1
+
+    def to_sticks(self):
+        """Return the transitions as stick data, with a stick of height
+        intensity_I at each wavenumber, and the label columns of the
+        transitions as the stick labels."""
+        sticks = stickData(self.fName)
+        sticks._set_sticks(self.dat['wavenumber'].to_numpy(), self.dat['intensity_I'].to_numpy())
+        sticks.labels = self.dat[self.labelCols]
+        return sticks
+
+    _cacheable = True
+    def _to_cache(self):
+        return {column: self.dat[column].to_numpy(dtype=None if self.typedict[column] is float else str)
+            for column in self.cols}
+
+    def _from_cache(self, arrays):
+        self.dat = pd.DataFrame({column: arrays[column] for column in self.cols}).astype(self.typedict)
+
+    def _index_file(self):
+        return self.fName + '.cmgidx'
+
+    def _read_index(self, stat):
+        """Block offsets from the sidecar index, if it matches the file."""
+        try:
+            with open(self._index_file(), 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get('size') != stat.st_size or index.get('mtime') != stat.st_mtime_ns:
+            return None
+        return index['start'], index['stop']
+
+    def _write_index(self, stat, offsets):
+        """Store the block offsets in the sidecar index, if possible."""
+        try:
+            with open(self._index_file(), 'w') as f:
+                json.dump({'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                    'start': offsets[0], 'stop': offsets[1]}, f)
+        except OSError:
+            pass
+
 class roueffData(_Data):
     """Data format for linelist in the format given by Roueff et al. 2019."""
+    _readsInteractively = True
+    @classmethod
+    def _sniff(cls, fName, head):
+        return len(_first_tokens(head)) == 16
+
     def read_file(self):
         """Read linelist from Komasa format."""
         with open(self.fName, 'r') as f:
@@ -213,23 +595,252 @@ class roueffData(_Data):
             }
         return self
         
+_c = 2.99792458e10 #speed of light, cm/s
+_c2 = 1.4387769 #second radiation constant, cm K
+
+class exomolTransData(stickData):
+    """Data format for ExoMol linelists, read from a '.trans' file of upper and
+    lower state IDs and Einstein A coefficients, and the '.states' file of the
+    same dataset. Sticks are placed at the transition wavenumbers with their
+    absorption intensity at the temperature set by the 'temperature' class
+    attribute, and labelled with the J of the upper and lower states.
+
+    The states are held in arrays indexed by state ID, so the energies of the
+    transitions are found with one numpy lookup. The transitions are parsed in
+    chunks, so with a wavenumber window only the lines inside it are kept."""
+    temperature = 296. #K
+    _windowed = True
+    _nCols = None #cannot be followed, see _Data.follow
+    _chunkSize = 10**6 #transitions parsed at a time
+    @classmethod
+    def _sniff(cls, fName, head):
+        tokens = _first_tokens(head)
+        transLike = len(tokens) in [3, 4] and tokens[0].isdigit() and tokens[1].isdigit()
+        return ('.trans' in os.path.basename(fName) or transLike) \
+            and os.path.isfile(cls(fName)._states_file())
+
+    def _states_file(self):
+        """The '.states' file of the dataset, the name of the '.trans' file
+        without its wavenumber range, e.g '__00000-00100'."""
+        stem = os.path.basename(self.fName).split('.trans')[0]
+        stem = re.sub(r'__\d+-\d+$', '', stem)
+        for suffix in ['.states', '.states.bz2']:
+            statesFile = os.path.join(os.path.dirname(self.fName), stem + suffix)
+            if os.path.isfile(statesFile):
+                return statesFile
+        return os.path.join(os.path.dirname(self.fName), stem + '.states')
+
+    def _sources(self):
+        return [self.fName, self._states_file()]
+
+    def read_file(self):
+        """Read the states, then the transitions chunk by chunk, and build the
+        sticks of the transitions inside the window."""
+        states = pd.read_csv(self._states_file(), sep=r'\s+', header=None, usecols=range(4),
+            names=['id', 'E', 'g', 'J'], dtype=float, engine='c').to_numpy()
+        ids = states[:, 0].astype(np.int64)
+        energy, g, J = [np.full(ids.max() + 1, np.nan) for i in range(3)]
+        energy[ids], g[ids], J[ids] = states[:, 1], states[:, 2], states[:, 3]
+        T = self.temperature
+        Q = np.nansum(g*np.exp(-_c2*energy/T)) #partition function
+        x, y, upper, lower = [], [], [], []
+        for chunk in pd.read_csv(self.fName, sep=r'\s+', header=None, dtype=float,
+                engine='c', chunksize=self._chunkSize):
+            chunk = chunk.to_numpy()
+            up, lo = chunk[:, 0].astype(np.int64), chunk[:, 1].astype(np.int64)
+            nu = chunk[:, 3] if chunk.shape[1] > 3 else energy[up] - energy[lo]
+            if self.window is not None:
+                keep = (nu >= self.window[0]) & (nu <= self.window[1])
+                up, lo, nu, chunk = up[keep], lo[keep], nu[keep], chunk[keep]
+            A = chunk[:, 2]
+            x.append(nu)
+            y.append(g[up]*A/(8*np.pi*_c*nu**2)*np.exp(-_c2*energy[lo]/T)
+                *(1 - np.exp(-_c2*nu/T))/Q)
+            upper.append(up)
+            lower.append(lo)
+        self._set_sticks(np.concatenate(x or [[]]), np.concatenate(y or [[]]))
+        self.labels = pd.DataFrame({
+            'rotational_final': J[np.concatenate(upper or [[]]).astype(np.int64)],
+            'rotational_initial': J[np.concatenate(lower or [[]]).astype(np.int64)]})
+        return self
+
+class hitranParData(stickData):
+    """Data format for HITRAN '.par' linelists, of fixed width 160 character
+    records. Sticks are placed at the line wavenumbers with the HITRAN line
+    intensities, and labelled with the molecule, isotopologue and global quanta.
+
+    The file is memory mapped and viewed as a numpy array of records of byte
+    string fields, which numpy converts to numbers, so no Python code runs per
+    line. With a wavenumber window, only the wavenumbers of all lines are
+    converted, and the other fields of the lines inside the window."""
+    _windowed = True
+    _nCols = None
+    _recordLength = 160
+    _fields = [('molecule', 'S2'), ('isotopologue', 'S1'), ('wavenumber', 'S12'),
+        ('intensity', 'S10'), ('einstein_A', 'S10'), ('gamma_air', 'S5'),
+        ('gamma_self', 'S5'), ('energy_lower', 'S10'), ('n_air', 'S4'),
+        ('delta_air', 'S8'), ('global_upper', 'S15'), ('global_lower', 'S15'),
+        ('local_upper', 'S15'), ('local_lower', 'S15'), ('rest', 'S33')]
+    @classmethod
+    def _sniff(cls, fName, head):
+        line = head.split(b'\n')[0].rstrip(b'\r')
+        return len(line) == cls._recordLength and line[:2].strip().isdigit() \
+            and _is_number(line[3:15].decode('ascii', 'replace'))
+
+    def read_file(self):
+        """Read the records of the file, within the window if one is set."""
+        with open(self.fName, 'rb') as f:
+            head = f.read(2*self._recordLength)
+            size = f.seek(0, os.SEEK_END)
+        recordLength = head.index(b'\n') + 1 if b'\n' in head else size #with line end
+        dtype = np.dtype(self._fields + [('eol', 'S{}'.format(recordLength - self._recordLength))])
+        nRecords = size//recordLength
+        records = np.memmap(self.fName, dtype=dtype, mode='r', shape=(nRecords,)) if nRecords \
+            else np.empty(0, dtype=dtype)
+        if size - nRecords*recordLength >= self._recordLength: #last line has no line end
+            with open(self.fName, 'rb') as f:
+                f.seek(nRecords*recordLength)
+                last = f.read().ljust(recordLength, b'\n')
+            records = np.concatenate([records, np.frombuffer(last, dtype=dtype)])
+        nu = records['wavenumber'].astype(float)
+        if self.window is not None:
+            keep = np.flatnonzero((nu >= self.window[0]) & (nu <= self.window[1]))
+            records, nu = records[keep], nu[keep]
+        self._set_sticks(nu, records['intensity'].astype(float))
+        self.labels = pd.DataFrame({
+            'molecule': records['molecule'].astype(int),
+            'isotopologue': records['isotopologue'].astype('U1'),
+            'global_upper': np.char.strip(records['global_upper'].astype('U15')),
+            'global_lower': np.char.strip(records['global_lower'].astype('U15'))})
+        return self
+
+### File type detection
+
+# Data classes tried by detect_filetype, in order, see register_filetype
+_fileTypes = [cmgData, hitranParData, exomolTransData, duoOutData, roueffData, stickData, xyData]
+_sniffBytes = 4096 #bytes read from the start of a file to detect its type
+
+def register_filetype(fileType):
+    """Add a Data class to the file types recognised by detect_filetype. It is
+    tried before the existing classes, so it can also replace a reader."""
+    _fileTypes.insert(0, fileType)
+
+def _first_tokens(head):
+    """Whitespace separated tokens of the first non-blank line of head."""
+    for line in head.split(b'\n')[:-1] or head.split(b'\n'):
+        tokens = line.decode('ascii', 'replace').split()
+        if tokens:
+            return tokens
+    return []
+
+def _is_number(token):
+    try:
+        float(token)
+        return True
+    except ValueError:
+        return False
+
 def detect_filetype(fName):
-    pref, suf = fName.split('.')
-    if suf == 'stick':
-        return stickData
-    elif suf == 'out':
-        return duoOutData
-    elif suf == 'cmg':
-        return cmgData
-    elif suf == 'txt':
-        f = open(fName, 'r')
-        firstLine = f.readline()
-        if len(firstLine.split()) == 2:
-            return xyData
-        elif len(firstLine.split()) == 16:
-            return roueffData
-    elif suf == 'csv':
-        return xyData
-    else:
-        print("File type not recognised")
+    """Return the Data class for a file, the first registered class whose
+    _sniff method recognises the file from its name and first bytes."""
+    try:
+        with open(fName, 'rb') as f:
+            head = f.read(_sniffBytes)
+    except OSError:
+        head = b''
+    for fileType in _fileTypes:
+        if fileType._sniff(fName, head):
+            return fileType
+    print("File type not recognised")
+
+def _source_key(_Data):
+    """Key identifying the data class, window and contents of the files a Data
+    object is read from, by their absolute paths, sizes and modification times."""
+    key = (type(_Data).__name__, _Data.window)
+    for fName in _Data._sources():
+        stat = os.stat(fName)
+        key += (os.path.abspath(fName), stat.st_size, stat.st_mtime_ns)
+    return key
+
+def _cache_file(_Data):
+    """Path of the persistent cache entry for a Data object, see _source_key.
+    Entries written by an older cache format are not found."""
+    key = '|'.join(str(part) for part in (_cacheVersion,) + _source_key(_Data))
+    return os.path.join(_cacheDir, hashlib.sha1(key.encode()).hexdigest() + '.npz')
+
+def _evict_cache():
+    """Remove the least recently used cache entries until the cache is within
+    its size limit."""
+    entries = []
+    for name in os.listdir(_cacheDir):
+        try:
+            stat = os.stat(os.path.join(_cacheDir, name))
+        except OSError: #removed by another reader
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(entry[1] for entry in entries)
+    for _, size, name in sorted(entries):
+        if total <= _cacheLimit:
+            break
+        try:
+            os.remove(os.path.join(_cacheDir, name))
+        except OSError:
+            pass
+        total -= size
+
+def _read_cached(_Data):
+    """Read a data file through the persistent cache of parsed arrays, parsing
+    the file and storing the result on a cache miss."""
+    if not _Data._cacheable or _cacheLimit <= 0:
+        return _Data.read_file()
+    cacheFile = _cache_file(_Data)
+    try:
+        with np.load(cacheFile, allow_pickle=False) as arrays:
+            _Data._from_cache({key: arrays[key] for key in arrays.files})
+        os.utime(cacheFile) #mark as recently used
+        return _Data
+    except (OSError, ValueError, KeyError):
+        pass
+    _Data.read_file()
+    arrays = _Data._to_cache()
+    if sum(array.nbytes for array in arrays.values()) > _cacheLimit: #would be evicted at once
+        return _Data
+    try:
+        os.makedirs(_cacheDir, exist_ok=True)
+        tmpFile = cacheFile + '.{}.tmp'.format(os.getpid())
+        with open(tmpFile, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmpFile, cacheFile)
+        _evict_cache()
+    except OSError:
+        pass
+    return _Data
 
+def read_data(fName, cache=None, window=None):
+    """Detect the type of a data file, read it and return the Data object.
+
+    Parsed arrays are kept in a persistent cache on disk, so reading a file
+    that has not changed since it was last read skips parsing.
+
+    If a cache dictionary is given, files that have already been read and have
+    not changed since are not read again. The returned object is then a
+    shallow copy sharing the parsed arrays, with its own file name.
+
+    If a (min, max) wavenumber window is given, readers that support it only
+    keep the lines inside the window.
+    """
+    fileType = detect_filetype(fName)
+    _Data = fileType(fName)
+    if window is not None:
+        if fileType._windowed:
+            _Data.window = tuple(float(w) for w in window)
+        else:
+            print("'{}' is read in full, a window is only used for ExoMol and HITRAN files.".format(fName))
+    if cache is None:
+        return _read_cached(_Data)
+    key = _source_key(_Data)
+    if key not in cache:
+        cache[key] = _read_cached(_Data)
+    _Data = copy.copy(cache[key])
+    _Data.fName = fName
+    return _Data
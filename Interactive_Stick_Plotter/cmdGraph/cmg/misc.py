@@ -0,0 +1,15 @@
+import importlib
+
+class LazyModule:
+    """Stand-in for a module that is only imported when one of its attributes
+    is first used, e.g
+
+    plt = LazyModule('matplotlib.pyplot')
+
+    defers the cost of importing pyplot until the first plt.<function> call.
+    """
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
@@ -1,13 +1,15 @@
 import cmd #for program commands
-import argparse #for figure arguments
-import numpy as np #for... need I explain?
-import matplotlib #urm... seems kinda obvious
-import matplotlib.pyplot as plt #convenience
 import sys
 import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
-from .data import xyData, stickData, cmgData, duoOutData, roueffData, detect_filetype
-from .view import GraphView, StickView, linelistComparisonView
+from .data import xyData, stickData, cmgData, duoOutData, roueffData, detect_filetype, read_data
+from .misc import LazyModule
+
+# Matplotlib and the View classes are imported when the first figure is made,
+# so the prompt starts without waiting for them
+plt = LazyModule('matplotlib.pyplot')
 
 ### User interface object
 
@@ -22,35 +24,67 @@ class cmgPrompt(cmd.Cmd):
     and passes commands to the current View instance.
     """
     prompt = '> ' #set left hand icon for prompt
+    _dataCache = None #dictionary of parsed files to reuse, see read_data
+    _background = True #read adat files in background threads
+    _loader = None #thread pool for background reads
+    _draft = True #render text with mathtext, and LaTeX only when printing
+    _rasterizeLimit = 10000 #plots with more elements are rasterized in vector prints
+    _printDpi = 300 #resolution of rasterized plots
+    _holding = False #True while a command is running, see _hold_draw
+    _blitOnly = False #True if the running command made only cheap changes
+    _blitArtists = [] #artists changed by the running command
 
     def __init__(self, mode='launch', **kwargs):
         """Initialise a new prompt mode. 
         
-        Creates a figure and sets the View object and Data type specified by the 
-        'mode' keyword argument. The default value is 'launch', which is used 
-        when the program starts to call the Cmd superclass __init__ function. 
-        Other keyword arguments are passed to the Cmd superclass.
+        Sets the View mode specified by the 'mode' keyword argument. The default
+        value is 'launch', which is used when the program starts to call the Cmd
+        superclass __init__ function. Other keyword arguments are passed to the
+        Cmd superclass. The figure and View instance are created when first
+        needed, see _View.
         """
-        plt.rc('text', usetex=True)
-        plt.rc('font', family='serif')
-        plt.ion()
-        self._modes = ['graph', 'stick', 'linelistComparison'] #define available modes
+        self._modes = ['graph', 'stick', 'multistick', 'broadened', 'linelistComparison'] #define available modes
         if mode == 'launch': #for first __init__
             cmd.Cmd.__init__(self, **kwargs)
             mode = 'stick' #default to stick
         if mode in self._modes:
             self.mode = mode
-            self.fig = plt.figure()
+            self._view = None
             self._single = False
-            if mode == 'graph':
-                self._View = GraphView(self.fig) #set the view mode
-            elif mode == 'stick':
-                self._View = StickView(self.fig)
-            elif mode == 'linelistComparison':
-                self._View = linelistComparisonView(self.fig)
+            self._pending = [] #background reads not yet added to the View
+            self._watched = [] #plots whose data files are followed for new lines
+            self._timer = None
         else:
             print("Mode not defined.")
 
+    @property
+    def _View(self):
+        """The View instance of the current mode, created along with its figure
+        on first use."""
+        if self._view is None:
+            from .view import GraphView, StickView, MultiStickView, BroadenedView, linelistComparisonView
+            plt.rc('text', usetex=not self._draft)
+            plt.rc('font', family='serif')
+            if not self._holding:
+                plt.ion()
+            fig = plt.figure()
+            if self.mode == 'graph':
+                self._view = GraphView(fig) #set the view mode
+            elif self.mode == 'stick':
+                self._view = StickView(fig)
+            elif self.mode == 'multistick':
+                self._view = MultiStickView(fig)
+            elif self.mode == 'broadened':
+                self._view = BroadenedView(fig)
+            elif self.mode == 'linelistComparison':
+                self._view = linelistComparisonView(fig)
+        return self._view
+
+    @property
+    def fig(self):
+        """The figure of the current View instance."""
+        return self._View.fig
+
     def onecmd(self, line):
         """Overwritten from default cmd.onecmd method to prevent exiting command
         loop when an error is raised.
@@ -69,10 +103,125 @@ class cmgPrompt(cmd.Cmd):
         else:
             try:
                 func = getattr(self, 'do_' + cmd)
+                self._blitOnly = False #only View arguments can be blitted
                 return func(arg)
             except AttributeError:
                 return self.default(line)
 
+    def precmd(self, line):
+        """Hold drawing while the command runs and add any files read in the
+        background to the View before running the next command."""
+        self._hold_draw()
+        self._attach_ready()
+        self._follow_watched()
+        return line
+
+    def postcmd(self, stop, line):
+        """Draw the figure once for all changes made by the command."""
+        self._release_draw()
+        return stop
+
+    ## Drawing ##
+    def _hold_draw(self):
+        """Stop matplotlib redrawing the figure after every change, so that a
+        command line, or a whole 'load', is drawn once by _release_draw."""
+        self._holding = True
+        self._blitOnly = True #until a change that is not cheap
+        self._blitArtists = []
+        if self._view is not None:
+            plt.ioff()
+
+    def _release_draw(self):
+        """Draw the changes made since _hold_draw. If the only changes were
+        cheap plot updates, such as colour changes, just the changed artists are
+        blitted over the cached figure."""
+        self._holding = False
+        if self._view is None:
+            return
+        plt.ion()
+        if not self.fig.stale:
+            return
+        if self._blitOnly and self._blitArtists:
+            self._View.blit(self._blitArtists)
+        else:
+            self._View.redraw()
+
+    ## Background loading ##
+    def _read_background(self, inFile, window=None):
+        """Submit a data file to be read in a background thread, so the prompt
+        stays responsive, and poll for it with a figure timer."""
+        if cmgPrompt._loader is None:
+            cmgPrompt._loader = ThreadPoolExecutor()
+        future = self._loader.submit(read_data, inFile, self._dataCache, window)
+        future.add_done_callback(lambda f: print("\nRead '{}'".format(inFile)
+            if f.exception() is None else "\nFailed to read '{}': {}".format(inFile, f.exception())))
+        self._pending.append((inFile, future))
+        self._start_polling()
+
+    def _start_polling(self):
+        """Start the figure timer that polls for finished background reads and
+        for new lines in watched files."""
+        if self._timer is None:
+            self._timer = self.fig.canvas.new_timer(interval=200)
+            self._timer.add_callback(self._poll_background)
+        self._timer.start()
+
+    def _poll_background(self):
+        """Figure timer callback adding finished reads, and new lines of watched
+        files, between commands."""
+        if self._holding: #added before the next command instead
+            return
+        self._hold_draw()
+        self._attach_ready()
+        self._follow_watched()
+        self._release_draw()
+
+    def _attach_ready(self):
+        """Add the files that have finished reading to the View, in the order
+        they finish. Called on the main thread by the figure timer and before
+        every command."""
+        for pending in [p for p in self._pending if p[1].done()]:
+            self._pending.remove(pending)
+            inFile, future = pending
+            if future.exception() is None:
+                self._View.add_plot(future.result())
+                self._blitOnly = False
+        if not self._pending and not self._watched and self._timer is not None:
+            self._timer.stop()
+
+    ## Watched files ##
+    def _watch(self, inFile):
+        """Add a data file to the View and keep following it, so that lines
+        appended to the file, e.g by a calculation that is still running, are
+        added to its plot. Only the new bytes of the file are parsed each time."""
+        fileType = detect_filetype(inFile)
+        if getattr(fileType, '_nCols', None) is None or not hasattr(fileType, '_append_rows'):
+            print("Cannot watch '{}', only stick and x-y files can be followed.".format(inFile))
+            return
+        _Data = fileType(inFile)
+        _Data.follow()
+        self._View.add_plot(_Data)
+        self._watched.append(self._View.plots[-1])
+        self._start_polling()
+
+    def _follow_watched(self):
+        """Add the new lines of watched files to their plots. Called on the main
+        thread by the figure timer and before every command."""
+        if not self._watched:
+            return
+        self._watched = [plot for plot in self._watched if plot in self._View.plots]
+        for plot in self._watched:
+            try:
+                rows = plot._Data.follow()
+            except OSError: #file is being replaced, try again next time
+                continue
+            except ValueError as err: #lines that cannot be parsed are left out
+                print("Could not read new lines of '{}': {}".format(plot._Data.fName, err))
+                continue
+            if rows is not None:
+                plot._data_changed(rows)
+                self._blitOnly = False
+
     ## Command methods ##
     def default(self, line):
         """Pass input string to the View instance's argparse parser if the string
@@ -86,6 +235,10 @@ class cmgPrompt(cmd.Cmd):
             print("Unrecognised argument.")
         else:
             self._changed = True
+            if self._View._blitArtists is None:
+                self._blitOnly = False
+            else:
+                self._blitArtists.extend(self._View._blitArtists)
 
     def do_exit(self, inp): #not working
         """Checks if in single plot mode, if so makes all View plots live,
@@ -117,12 +270,70 @@ class cmgPrompt(cmd.Cmd):
         as plot.
         
         """
-        for inFile in inp.split(): #assume spaces in input delimit files
-            fileType = detect_filetype(inFile) #detect data type
-            _Data = fileType(inFile).read_file() #read input file and return data object
+        inFiles = inp.split() #assume spaces in input delimit files
+        watch = '--watch' in inFiles or '-w' in inFiles
+        window = None
+        if '--window' in inFiles: #only read lines between two wavenumbers
+            i = inFiles.index('--window')
+            window = inFiles[i+1:i+3]
+            del inFiles[i:i+3]
+        for inFile in [f for f in inFiles if f not in ['--watch', '-w']]:
+            if watch:
+                self._watch(inFile)
+                continue
+            fileType = detect_filetype(inFile)
+            interactive = getattr(fileType, '_readsInteractively', False) or self._View._addsInteractively
+            if self._background and not interactive: #input() only works on the main thread
+                self._read_background(inFile, window) #added to the View when ready
+                continue
+            _Data = read_data(inFile, self._dataCache, window) #read input file and return data object
             self._View.add_plot(_Data) #call view mode add plot function
     def help_adat(self):
-        print("usage: adat <file1> <file2> ... \n    Add lines(s) to figure from file(s). ")
+        print("usage: adat [--watch] <file1> <file2> ... \n    Add lines(s) to figure from file(s). "
+            "Files are read in the background and added to the figure as soon as they are read.\n"
+            "    With --watch (-w), lines appended to the files later are added to the figure, see 'unwatch'.\n"
+            "    With --window <min> <max>, only lines between the two wavenumbers are read from ExoMol and HITRAN files.")
+
+    def do_unwatch(self, inp):
+        """Stop following the given watched files, or all watched files."""
+        unwatched = [plot for plot in self._watched if not inp or plot._Data.fName in inp.split()]
+        for plot in unwatched:
+            self._watched.remove(plot)
+            print("Stopped watching '{}'".format(plot._Data.fName))
+    def help_unwatch(self):
+        print("usage: unwatch <file1> <file2> ... \n    Stop adding new lines of watched files to the figure, "
+            "for all watched files if none are given.")
+
+    def do_peaks(self, inp):
+        """Find the peaks of an x-y spectrum above a noise threshold, write them
+        to a '.stick' file and, if the View draws sticks, add them to the figure.
+        """
+        args = inp.split()
+        minSeparation = 0.
+        if '--separation' in args: #only the highest of peaks closer than this
+            i = args.index('--separation')
+            minSeparation = float(args[i+1])
+            del args[i:i+2]
+        if not args:
+            self.help_peaks()
+            return
+        inFile = args[0]
+        nSigma = float(args[1]) if len(args) > 1 else 5.
+        outFile = args[2] if len(args) > 2 else os.path.splitext(inFile)[0] + '.peaks.stick'
+        _Data = read_data(inFile, self._dataCache)
+        if not isinstance(_Data, xyData):
+            print("'{}' is not an x-y spectrum.".format(inFile))
+            return
+        sticks = _Data.find_peaks(nSigma, minSeparation, fName=outFile)
+        np.savetxt(outFile, sticks.dat[:, 1, :], fmt='%.12g')
+        print("Found {} peaks, written to '{}'".format(len(sticks.dat), outFile))
+        if self.mode in ['stick', 'multistick', 'broadened']:
+            self._View.add_plot(sticks)
+    def help_peaks(self):
+        print("usage: peaks [--separation <dx>] <file> [nsigma] [out.stick]\n    Find the peaks of an x-y spectrum that are more than nsigma "
+            "(default 5) times the noise above the baseline,\n    and stand out from the dips either side by as much, and write them to a stick file "
+            "(default <file>.peaks.stick),\n    which is added to the figure in stick modes. "
+            "With --separation, only the highest of peaks closer than dx is kept.")
 
     def do_ddat(self, inp):
         """Remove a data file from the figure. Not working yet, placeholder only.
@@ -162,12 +373,13 @@ class cmgPrompt(cmd.Cmd):
         
         """
         if inp in self._modes:
-            plt.close(fig='all')
+            if self._view is not None:
+                plt.close(fig='all')
             self.__init__(mode=inp)
         else:
             print("Mode not defined.")
     def help_mode(self):
-        print("usage: mode <mode>\n    Change figure mode (graph, stick)")
+        print("usage: mode <mode>\n    Change figure mode (graph, stick, multistick, broadened)")
 
     def do_save(self, inp):
         """Save configuration for current figure in a native cmdGraph 'save file'.
@@ -194,8 +406,12 @@ class cmgPrompt(cmd.Cmd):
         each item in the data attribute as though it were a user command.
         """
         buff = cmgData(inp).read_file()
-        for cmdString in buff.dat:
-            self.onecmd(cmdString)
+        background, self._background = self._background, False #later commands need the plots in place
+        try:
+            for cmdString in buff.dat:
+                self.onecmd(cmdString)
+        finally:
+            self._background = background
         if self._single:
             self.do_exit('')
         self._savefile = inp
@@ -214,16 +430,149 @@ class cmgPrompt(cmd.Cmd):
                     i +=1
                 self._printfile = "autoprint{0}.pdf".format(i)
             inp = self._printfile
-        plt.savefig(inp)
+        fileType = os.path.splitext(inp)[1][1:].lower() or plt.rcParams['savefig.format']
+        rasterized = []
+        if fileType in _vectorFormats and self._rasterizeLimit is not None:
+            rasterized = _rasterize_dense(self.fig, self._rasterizeLimit)
+        kwargs = {'dpi': self._printDpi} if rasterized else {}
+        try:
+            if self._draft: #final figures are always typeset with LaTeX
+                with plt.rc_context({'text.usetex': True}):
+                    _set_usetex(self.fig, True)
+                    try:
+                        self.fig.savefig(inp, **kwargs)
+                    finally:
+                        _set_usetex(self.fig, False)
+            else:
+                self.fig.savefig(inp, **kwargs)
+        finally:
+            for artist in rasterized:
+                artist.set_rasterized(False)
     def help_print(self):
         print("usage print <filename>.<filetype>\n    Print figure to file.")
 
+    def do_rasterize(self, inp):
+        """Set the number of elements (sticks, points or mesh cells) above which
+        a plot is rasterized when the figure is printed to a vector format, and
+        optionally the resolution it is rasterized at. Axes, text and smaller
+        plots stay vector graphics, so the file size and the time taken to print
+        are bounded however large the data is.
+        """
+        args = inp.split()
+        if not args:
+            print("Plots with more than {} elements are rasterized at {} dpi.".format(
+                self._rasterizeLimit, self._printDpi) if self._rasterizeLimit is not None
+                else "Rasterization is off.")
+            return
+        self._rasterizeLimit = None if args[0] == 'off' else int(args[0])
+        if len(args) > 1:
+            self._printDpi = float(args[1])
+    def help_rasterize(self):
+        print("usage: rasterize <n>|off [dpi]\n    Rasterize plots with more than n elements "
+            "when printing to a vector format (pdf, eps, svg), at the given dpi (default 300).")
+
+    def do_draft(self, inp):
+        """Switch draft rendering on or off. In draft mode text is rendered with
+        matplotlib's mathtext while working, which is much faster than LaTeX,
+        and with LaTeX only when printing. Compiled LaTeX text is kept in
+        matplotlib's tex cache, so repeated prints only typeset changed text.
+        """
+        if inp not in ['on', 'off']:
+            print("Draft mode is {}.".format('on' if self._draft else 'off'))
+            return
+        self._draft = inp == 'on'
+        plt.rc('text', usetex=not self._draft)
+        if self._view is not None:
+            _set_usetex(self.fig, not self._draft)
+            self.fig.canvas.draw_idle()
+    def help_draft(self):
+        print("usage: draft on|off\n    Render text with mathtext while working (on, default), "
+            "or with LaTeX at all times (off). Printing always uses LaTeX.")
+
     def do_tight(self, inp):
         """Apply matplotlib tight_layout."""
-        plt.tight_layout()
+        self.fig.tight_layout()
     def help_tight(self):
         print("usage: tight\n    Apply tight layout.")
 
+def _set_usetex(fig, usetex):
+    """Switch LaTeX rendering on or off for all text already in a figure,
+    including the tick label formatters that decide the tick text."""
+    from matplotlib.text import Text
+    for text in fig.findobj(Text):
+        text.set_usetex(usetex)
+    for ax in fig.axes:
+        for axis in [ax.xaxis, ax.yaxis]:
+            for formatter in [axis.get_major_formatter(), axis.get_minor_formatter()]:
+                if hasattr(formatter, 'set_usetex'):
+                    formatter.set_usetex(usetex)
+
+_vectorFormats = ['pdf', 'ps', 'eps', 'svg', 'svgz', 'pgf']
+
+def _element_count(artist):
+    """Number of separately drawn elements in a plot artist, e.g the sticks of
+    a LineCollection or the points of a line."""
+    from matplotlib.collections import Collection, QuadMesh
+    from matplotlib.lines import Line2D
+    if isinstance(artist, QuadMesh):
+        return artist.get_array().size
+    if isinstance(artist, Collection):
+        return max(len(artist.get_paths()), len(artist.get_offsets()))
+    if isinstance(artist, Line2D):
+        return len(artist.get_xdata())
+    return 0
+
+def _rasterize_dense(fig, limit):
+    """Rasterize the artists of a figure with more than limit elements, and
+    return them so that they can be switched back after printing."""
+    dense = [artist for artist in fig.findobj()
+        if not artist.get_rasterized() and _element_count(artist) > limit]
+    for artist in dense:
+        artist.set_rasterized(True)
+    return dense
+
 def run():
     """Run the cmdGraph program."""
     cmgPrompt(mode='launch').cmdloop() #run program
+
+def _batch_init():
+    """Set up a batch worker process with a non-GUI backend and a cache of
+    parsed data files shared by every figure the worker renders."""
+    plt.switch_backend('Agg')
+    cmgPrompt._dataCache = {}
+
+def _batch_render(cmgFile, outFile):
+    """Replay a cmdGraph save file and print the figure to outFile. Relative
+    data file names in the save file are taken relative to its directory."""
+    cwd = os.getcwd()
+    outFile = os.path.abspath(outFile)
+    os.chdir(os.path.dirname(os.path.abspath(cmgFile)))
+    try:
+        prompt = cmgPrompt(mode='launch')
+        prompt._hold_draw() #nothing needs drawing until the print
+        prompt.do_load(os.path.basename(cmgFile))
+        prompt.do_print(outFile)
+    finally:
+        plt.close(fig='all')
+        os.chdir(cwd)
+    return outFile
+
+def batch(cmgFiles, outDir=None, fileType='pdf', nWorkers=None):
+    """Render cmdGraph save files without the prompt, in a pool of worker
+    processes. Each figure is printed to '<outDir>/<name>.<fileType>', or next
+    to its save file if no output directory is given.
+    """
+    outFiles = []
+    for cmgFile in cmgFiles:
+        name = os.path.splitext(os.path.basename(cmgFile))[0] + '.' + fileType
+        outFiles.append(os.path.join(outDir or os.path.dirname(cmgFile), name))
+    if outDir:
+        os.makedirs(outDir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=nWorkers, initializer=_batch_init) as pool:
+        futures = {pool.submit(_batch_render, cmgFile, outFile): cmgFile
+            for cmgFile, outFile in zip(cmgFiles, outFiles)}
+        for future in as_completed(futures):
+            try:
+                print("{} -> {}".format(futures[future], future.result()))
+            except Exception as err:
+                print("{} failed: {}".format(futures[future], err))
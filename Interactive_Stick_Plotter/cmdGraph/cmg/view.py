@@ -5,10 +5,170 @@ import matplotlib #urm... seems kinda obvious
 import matplotlib.pyplot as plt #convenience
 import pandas as pd
 import sys
+import os
+from collections import OrderedDict
 
-from .data import xyData, stickData, cmgData, duoOutData, roueffData, detect_filetype
+from .data import xyData, stickData, cmgData, duoOutData, roueffData, read_data, _small_
 
 
+### Helper functions
+
+def _pixel_width(ax):
+    """Width of the axes in screen pixels."""
+    return max(int(ax.get_window_extent().width), 1)
+
+def _bin_edges(ax, xmin, xmax, nBins):
+    """Edges of nBins bins of equal screen width between xmin and xmax."""
+    if ax.get_xscale() == 'log' and xmin > 0:
+        return np.geomspace(xmin, xmax, nBins + 1)
+    return np.linspace(xmin, xmax, nBins + 1)
+
+def _bin_maxima(x, y, edges, ufunc=np.maximum):
+    """Return the index of the largest y value in each bin of the sorted x
+    values, skipping empty bins. Found with searchsorted and a maximum.reduceat
+    over the bins, so the cost is linear in the number of points in range. Pass
+    ufunc=np.minimum for the smallest value instead."""
+    starts = np.searchsorted(x, edges)
+    lo, hi = starts[0], starts[-1]
+    counts = np.diff(starts)
+    filled = counts > 0
+    if not filled.any():
+        return np.array([], dtype=int)
+    yIn = y[lo:hi]
+    maxima = ufunc.reduceat(yIn, starts[:-1][filled] - lo)
+    binOf = np.repeat(np.arange(len(maxima)), counts[filled])
+    atMax = np.flatnonzero(yIn == maxima[binOf])
+    _, first = np.unique(binOf[atMax], return_index=True) #first stick at each maximum
+    return atMax[first] + lo
+
+def _typed_frame(data):
+    """Typed dataframe of a linelist Data object, whose dat attribute is either
+    already a typed dataframe or an array of strings."""
+    if isinstance(data.dat, pd.DataFrame):
+        return data.dat
+    return pd.DataFrame(data=data.dat, columns=data.cols).astype(data.typedict)
+
+def _packed_keys(left, right, on):
+    """Pack the key columns of two dataframes into one int64 key per row. Each
+    column is factorised over both frames, with NaN as its own code, so equal
+    keys in the two frames get equal packed keys."""
+    leftKey = np.zeros(len(left), dtype=np.int64)
+    rightKey = np.zeros(len(right), dtype=np.int64)
+    size = 1
+    for column in on:
+        codes, uniques = pd.factorize(np.concatenate([left[column].to_numpy(), right[column].to_numpy()]))
+        nCodes = len(uniques) + 1
+        size *= nCodes
+        if size >= 2**63:
+            raise OverflowError("Too many distinct keys to pack into int64.")
+        codes = codes + 1 #NaN is -1
+        leftKey = leftKey*nCodes + codes[:len(left)]
+        rightKey = rightKey*nCodes + codes[len(left):]
+    return leftKey, rightKey
+
+def _inner_join(leftKey, rightKey):
+    """Row indices (leftIdx, rightIdx) of the inner join of two packed key
+    arrays, using an argsort index of the right keys and searchsorted. Rows of
+    the left are kept in order, with one entry for every matching right row."""
+    order = np.argsort(rightKey, kind='stable')
+    sortedKeys = rightKey[order]
+    lo = np.searchsorted(sortedKeys, leftKey, side='left')
+    counts = np.searchsorted(sortedKeys, leftKey, side='right') - lo
+    leftIdx = np.repeat(np.arange(len(leftKey)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return leftIdx, order[np.repeat(lo, counts) + offsets]
+
+_joinCache = OrderedDict() #(merge columns, file pair) -> join row indices
+_joinCacheSize = 8 #file pairs kept, least recently used first out
+
+def _cached_join(leftFile, left, rightFile, right, on):
+    """Join row indices of two linelist files on the given columns, cached for
+    as long as neither file changes. Joins of earlier versions of the same
+    files are dropped, and only the most recently used joins are kept."""
+    key = (tuple(on),)
+    for fName in [leftFile, rightFile]:
+        stat = os.stat(fName)
+        key += ((os.path.abspath(fName), stat.st_size, stat.st_mtime_ns),)
+    if key in _joinCache:
+        _joinCache.move_to_end(key)
+        return _joinCache[key]
+    sameFiles = lambda other: other[0] == key[0] and [f[0] for f in other[1:]] == [f[0] for f in key[1:]]
+    for stale in [other for other in _joinCache if sameFiles(other)]: #the files have changed
+        del _joinCache[stale]
+    _joinCache[key] = _inner_join(*_packed_keys(left, right, on))
+    if len(_joinCache) > _joinCacheSize:
+        _joinCache.popitem(last=False)
+    return _joinCache[key]
+
+def _line_profile(x, hwhm, lorentz=0.0):
+    """Area normalised pseudo-Voigt line profile with half width at half
+    maximum hwhm, the sum of a Gaussian and a fraction lorentz of a Lorentzian
+    of the same width. lorentz=0 gives a pure Gaussian profile."""
+    gauss = np.sqrt(np.log(2)/np.pi)/hwhm*np.exp(-np.log(2)*(x/hwhm)**2)
+    if not lorentz:
+        return gauss
+    return (1 - lorentz)*gauss + lorentz/(np.pi*hwhm)/(1 + (x/hwhm)**2)
+
+def _broaden(x, y, xmin, xmax, nPoints, hwhm, lorentz=0.0):
+    """Broaden the sticks at sorted positions x with intensities y onto a grid
+    of nPoints between xmin and xmax. The sticks within reach of the grid are
+    shared between their two nearest points of a wider grid, which is then
+    convolved with the sampled profile using an FFT, so the cost grows with the
+    number of sticks and grid points rather than their product. The profile is
+    cut off where it falls below about 1e-4 of its peak. Returns the grid and
+    the broadened spectrum on it."""
+    step = (xmax - xmin)/(nPoints - 1)
+    reach = hwhm*(3.5 if not lorentz else 100) #Lorentzian wings fall off slowly
+    nKernel = int(np.ceil(reach/step))
+    if nKernel > 4*nPoints: #profile much wider than the view, coarsen the grid
+        step = reach/(4*nPoints)
+        nKernel = 4*nPoints
+    kernel = _line_profile(np.arange(-nKernel, nKernel + 1)*step, hwhm, lorentz)
+    kernel /= kernel.sum()*step #area normalised, also for profiles narrower than a step
+    nGrid = int(np.ceil((xmax - xmin)/step)) + 1
+    start = xmin - nKernel*step
+    lo, hi = np.searchsorted(x, [start, start + (nGrid + 2*nKernel - 1)*step])
+    pos = (x[lo:hi] - start)/step
+    left = np.floor(pos).astype(int)
+    frac = pos - left
+    nWide = nGrid + 2*nKernel
+    binned = np.bincount(left, y[lo:hi]*(1 - frac), minlength=nWide + 1)
+    binned += np.bincount(left + 1, y[lo:hi]*frac, minlength=nWide + 1)
+    nFFT = nWide + len(kernel)
+    spectrum = np.fft.irfft(np.fft.rfft(binned[:nWide], nFFT)*np.fft.rfft(kernel, nFFT), nFFT)
+    grid = xmin + np.arange(nGrid)*step
+    return grid, spectrum[2*nKernel:2*nKernel + nGrid]
+
+def _as_sticks(data):
+    """Stick data for a Data object, converting data that can be drawn as
+    sticks, e.g Duo transitions, with its to_sticks method."""
+    return data.to_sticks() if hasattr(data, 'to_sticks') else data
+
+def _categories(frame):
+    """Category of each row of a dataframe of label columns, and the sorted
+    list of distinct label tuples. Each column is factorised and its codes are
+    combined with the categories of the columns before it, which are then
+    numbered again from 0, so the combined code cannot overflow however many
+    columns there are, and no Python loop runs over the rows."""
+    codes = np.zeros(len(frame), dtype=np.int64)
+    columnCodes = np.zeros((1, 0), dtype=np.int64) #code of each column, per category
+    uniques = []
+    for column in frame.columns:
+        colCodes, colUniques = pd.factorize(frame[column], sort=True, use_na_sentinel=False)
+        nCodes = len(colUniques)
+        combined, codes = np.unique(codes*nCodes + colCodes, return_inverse=True)
+        columnCodes = np.c_[columnCodes[combined//nCodes], combined % nCodes]
+        uniques.append(np.asarray(colUniques))
+    return codes, list(zip(*(colUniques[columnCodes[:, i]] for i, colUniques in enumerate(uniques))))
+
+def _category_colours(n):
+    """RGBA colours for n categories, from the colour cycle if there are few
+    enough categories, otherwise spread over a colour map."""
+    cycle = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+    if n <= len(cycle):
+        return matplotlib.colors.to_rgba_array(cycle[:n])
+    return matplotlib.colormaps['turbo'](np.linspace(0, 1, n))
+
 ### View Classes
 
 class _View:
@@ -27,6 +187,7 @@ class _View:
     
     See existing subclasses for examples.
     """
+    _addsInteractively = False #True if add_plot asks the user for input
     def __init__(self, figure=None, mode=None):
         """View mode superclass with necessary functions, do not overwrite."""
         matplotlib.rcParams['axes.prop_cycle'] = matplotlib.cycler(color=[
@@ -43,6 +204,11 @@ class _View:
         self.plots     = []
         self.livePlots = self.plots
         self.argNames  = []
+        self._blitArtists = None #artists changed by the last command, if cheap
+        self._background  = None #figure pixels at the last full draw
+        self._hidden      = [] #artists left out of the next full draw
+        self._backgroundExcludes = [] #artists missing from self._background
+        self.fig.canvas.mpl_connect('draw_event', self._store_background)
         self.parser    = argparse.ArgumentParser(
             usage="Figure commands should have a '-' or '--' in front.\n"
             "       Type '-h' for a list of figure commands available in the current mode."
@@ -69,6 +235,11 @@ class _View:
             args = self.parser.parse_args(inp) #use argparse to parse args
         except:
             return False
+        parsed = [argName for argName in self.argNames if hasattr(args, argName)]
+        if parsed and all(argName in self._blitArgs for argName in parsed):
+            self._blitArtists = [plot._plot for plot in self.livePlots]
+        else:
+            self._blitArtists = None
         for argName in self.argNames:
             if hasattr(args, argName):
                 inp = getattr(args, argName)
@@ -81,6 +252,49 @@ class _View:
                         _set(inp[p])
         return True
 
+    # Plot arguments whose changes can be drawn by blitting the plot artists
+    # over the figure from the last draw, instead of redrawing the figure
+    _blitArgs = ['linecolour']
+
+    def _store_background(self, event):
+        """Keep the figure pixels after every full draw for blitting."""
+        if self.fig.canvas.supports_blit:
+            self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+            self._backgroundExcludes = list(self._hidden)
+
+    def redraw(self):
+        """Draw the figure once, and process GUI events so that it appears."""
+        self.fig.canvas.draw_idle()
+        self.fig.canvas.flush_events()
+
+    def blit(self, artists=None):
+        """Draw only the changed artists, by default those of the last command,
+        over a background of the figure without them. The background is drawn
+        once with the artists hidden, so repeated changes to the same artists,
+        e.g stepping through colours, are cheap. Falls back to redraw() if
+        blitting is not possible."""
+        canvas = self.fig.canvas
+        if artists is None:
+            artists = self._blitArtists
+        if artists is None or not canvas.supports_blit:
+            return self.redraw()
+        artists = [artist for artist in artists if artist.get_visible()] #hidden ones stay hidden
+        if self._background is None or set(artists) != set(self._backgroundExcludes):
+            self._hidden = artists
+            for artist in artists:
+                artist.set_visible(False)
+            try:
+                canvas.draw() #full draw, stores the background without them
+            finally:
+                for artist in artists:
+                    artist.set_visible(True)
+                self._hidden = []
+        canvas.restore_region(self._background)
+        for artist in artists:
+            artist.axes.draw_artist(artist)
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
     def _add_arg(self, *args, **kwargs):
         """Adds argument to View instance, essentially a wrapper for argparse
         'add_argument' that forces default to SUPPRESS and adds the argument
@@ -108,6 +322,31 @@ class _View:
             self._Data = data
             self.ax  = ax
 
+        # Fraction of the x range either side of the view kept in the artists,
+        # so that small pans do not expose undrawn data before the next update
+        _margin = 0.05
+
+        def _connect_view(self):
+            """Call self._update_view whenever the x limits or figure size
+            change, so that the plot only holds the data in view."""
+            self.ax.callbacks.connect('xlim_changed', self._update_view)
+            self.ax.figure.canvas.mpl_connect('resize_event', self._update_view)
+
+        def _in_range(self, x):
+            """Indices lo, hi bounding the x-sorted values inside the current x
+            limits plus the margin, found with searchsorted."""
+            xmin, xmax = sorted(self.ax.get_xlim())
+            margin = self._margin*(xmax - xmin)
+            return np.searchsorted(x, [xmin - margin, xmax + margin])
+
+        def _data_changed(self, rows):
+            """Update the plot after the rows (x, y) have been added to its Data
+            object by following the data file, see cmgPrompt._follow_watched.
+            The axes limits grow to fit the new data unless they have been set."""
+            self.ax.update_datalim(rows[:, :2])
+            self._update_view()
+            self.ax.autoscale_view()
+
     def add_plot(self, data):
         """Method for adding a Plot instance to the current View with data from
         a given Data object. Adds plot to list of plots in current View and resets
@@ -187,6 +426,9 @@ class GraphView(_View):
             help="marker sizes for plots in figure (any valid matplotlib style, e.g '-', '--', 'none')")
         self._add_arg('-l',  '--label',      nargs='+', type=str,   metavar='str',
             help="labels for plots in figure legend, use '#' for spaces")
+        # Axes arguments
+        self._add_arg('-dec', '--decimate', nargs=1, type=str, metavar='str',
+            help="'on' to draw only the min and max point in each pixel column, 'off' to draw every point")
         # Note: argparse does not always handle more exotic variable types and
         # uses in the expected manner. As a result we prefer to use either float
         # or int values, and parse arrays, tuples etc. as multiple arguments, or
@@ -212,6 +454,42 @@ class GraphView(_View):
             _View.Plot.__init__(self, data, ax)
             x, y = self._Data.dat
             self._plot, = ax.plot(x, y)
+            if self._Data.isSorted: #only cull data that is ordered in x
+                self._connect_view()
+        # View methods
+        _decimate = False
+        def _visible(self):
+            """Index of the points to draw in the current x range, with one extra
+            point either side so the line runs to the edge of the axes. With
+            decimation on, and more than two points in range per pixel column,
+            only the min and max point in each pixel column are drawn, which
+            preserves the peaks and the envelope of the spectrum."""
+            x, y = self._Data.dat
+            lo, hi = self._in_range(x)
+            nPix = _pixel_width(self.ax)
+            visible = slice(max(lo - 1, 0), min(hi + 1, len(x)))
+            if not self._decimate or hi - lo <= 2*nPix:
+                return visible
+            xmin, xmax = sorted(self.ax.get_xlim())
+            margin = self._margin*(xmax - xmin) #bins cover every point in range
+            edges = _bin_edges(self.ax, xmin - margin, xmax + margin, int(nPix*(1 + 2*self._margin)))
+            extrema = np.union1d(_bin_maxima(x, y, edges),
+                _bin_maxima(x, y, edges, ufunc=np.minimum))
+            return np.r_[visible.start:lo, extrema, hi:visible.stop].astype(int)
+        def _update_view(self, *args):
+            """Swap in the points in view, called whenever the x limits or figure
+            size change."""
+            x, y = self._Data.dat
+            if not self._Data.isSorted: #unordered data that was followed
+                self._plot.set_data(x, y)
+                return
+            visible = self._visible()
+            self._plot.set_data(x[visible], y[visible])
+        def _set_decimation(self, on):
+            """Switch min/max decimation on or off."""
+            self._decimate = on
+            if self._Data.isSorted:
+                self._update_view()
         # Line methods
         def _set_linewidth(self, inp):
             """Set line width of plot."""
@@ -253,9 +531,18 @@ class GraphView(_View):
 
     def add_plot(self, data):
         _View.add_plot(self, data)
+        if getattr(self, '_prop_decimate', 'off') == 'on':
+            self.plots[-1]._set_decimation(True)
         self._set_xrange('* *')
         self._set_yrange('* *')
 
+    def _set_decimate(self, inp):
+        """Switch min/max decimation on or off for all plots. The full resolution
+        data is kept by each plot's Data object."""
+        self._prop_decimate = inp[0]
+        for plot in self.plots:
+            plot._set_decimation(inp[0] == 'on')
+
 class StickView(_View):
     """Simple x-y data View class.
     
@@ -286,6 +573,11 @@ class StickView(_View):
             help="marker sizes for plots in figure (any valid matplotlib style, e.g '-', '--', 'none')")
         self._add_arg('-l', '--label', nargs='+', type=str,   metavar='str',
             help="labels for plots in figure legend, use '#' for spaces")
+        self._add_arg('-cb', '--colourby', nargs='+', type=str,   metavar='str',
+            help="label columns to colour sticks by, e.g 'vibrational_final' or 'electronic_final,vibrational_final', 'none' for one colour")
+        # Axes arguments
+        self._add_arg('-lod', '--levelofdetail', nargs=1, type=str, metavar='str',
+            help="'on' to draw only the tallest stick in each pixel column, 'off' to draw every stick")
         # Note: argparse does not always handle more exotic variable types and
         # uses in the expected manner. As a result we prefer to use either float
         # or int values, and parse arrays, tuples etc. as multiple arguments, or
@@ -307,11 +599,51 @@ class StickView(_View):
             '_prop_' attribute to allow the configuration to be written to file.
             """
             _View.Plot.__init__(self, data, ax)
-            sticks = self._Data.dat
+            sticks = self._Data.sort().dat
             self._plot = ax.add_collection(
                 matplotlib.collections.LineCollection(sticks))
-            self._prop_linecolour = self._plot._edgecolors[0]
+            self._prop_linecolour = matplotlib.colors.to_hex(self._plot._edgecolors[0]) #as written to save files
             self._markers = None
+            self._segmentColours = None #colour of each stick, see _set_colourby
+            self._lod = False
+            self._shown = None #(lo, hi) of the sticks in the collection, see _update_view
+            self._connect_view()
+        # View methods
+        def _visible(self):
+            """Index of the sticks to draw in the current x range. With level of
+            detail on, and more sticks in range than pixel columns, only the
+            tallest stick in each pixel column is drawn."""
+            x = self._Data.dat[:, 1, 0]
+            lo, hi = self._in_range(x)
+            nPix = _pixel_width(self.ax)
+            if not self._lod or hi - lo <= nPix:
+                return slice(lo, hi)
+            xmin, xmax = sorted(self.ax.get_xlim())
+            return _bin_maxima(x, self._Data.dat[:, 1, 1], _bin_edges(self.ax, xmin, xmax, nPix))
+        def _update_view(self, *args):
+            """Swap in the sticks to draw for the current view, called whenever
+            the x limits or figure size change. Nothing is done if the same
+            range of sticks is already in the collection, e.g for small pans."""
+            visible = self._visible()
+            shown = (visible.start, visible.stop) if isinstance(visible, slice) else None
+            if shown is not None and shown == self._shown:
+                return
+            self._shown = shown
+            self._plot.set_segments(self._Data.dat[visible])
+            if self._segmentColours is not None:
+                self._plot.set_color(self._segmentColours[visible])
+        def _set_lod(self, on):
+            """Switch level of detail rendering on or off."""
+            self._lod = on
+            self._update_view()
+        def _data_changed(self, rows):
+            """Update the sticks, and their markers, after new sticks have been
+            added to the Data object."""
+            self._shown = None #same range may now hold other sticks
+            baseline = np.c_[rows[:, 0], np.full(len(rows), _small_)]
+            _View.Plot._data_changed(self, np.r_[rows[:, :2], baseline])
+            if self._markers is not None:
+                self._markers.set_data(self._Data.dat[:, 1, 0], self._Data.dat[:, 1, 1])
         # Line methods
         def _set_linewidth(self, inp):
             """Set line width of plot."""
@@ -327,6 +659,9 @@ class StickView(_View):
             except:
                 pass
             self._prop_linecolour = inp
+            self._segmentColours = None
+            if hasattr(self, '_prop_colourby'):
+                del self._prop_colourby
             plt.setp(self._plot, color=inp)
         def _set_linestyle(self, inp):
             """Set line style of plot."""
@@ -367,15 +702,198 @@ class StickView(_View):
                     plt.setp(self._plot, label=inp)
                 else:
                     plt.setp(self._markers, label=inp)
-            plt.legend()
+            self.ax.legend()
+
+        # Most categories listed in the legend by _set_colourby
+        _maxLegend = 20
+        def _set_colourby(self, inp):
+            """Colour each stick by the values of one or more label columns of
+            its transition, separated by commas. Every stick keeps its place in
+            the one LineCollection, with its colour looked up from its category
+            in a colour array. 'none' returns to a single colour."""
+            if inp == 'none':
+                self._prop_colourby = inp
+                self._segmentColours = None
+                plt.setp(self._plot, color=self._prop_linecolour)
+                return
+            labels = self._Data.labels
+            columns = inp.split(',')
+            if labels is None:
+                print("'{}' has no labels to colour by.".format(self._Data.fName))
+                return
+            if any(column not in labels.columns for column in columns):
+                print("Label not recognised, use one of: " + ', '.join(labels.columns))
+                return
+            self._prop_colourby = inp
+            codes, categories = _categories(labels[columns])
+            colours = _category_colours(len(categories))
+            self._segmentColours = colours[codes]
+            self._plot.set_color(self._segmentColours[self._visible()]) #segments are unchanged
+            handles = [matplotlib.lines.Line2D([], [], color=colour) for colour in colours[:self._maxLegend]]
+            names = [', '.join('{:g}'.format(value) if isinstance(value, float) else str(value)
+                for value in category) for category in categories[:self._maxLegend]]
+            self.ax.legend(handles, names, title=', '.join(columns).replace('_', ' '))
 
         def _add_stick_markers(self):
             "Plots scatter graph as markers for stick view"
-            self._markers, = plt.plot(self._Data.dat[:,1,0], self._Data.dat[:,1,1], 
+            self._markers, = self.ax.plot(self._Data.dat[:,1,0], self._Data.dat[:,1,1], 
                                      linestyle='none', linewidth=0,
                                      color=self._prop_linecolour)
 
+    def add_plot(self, data):
+        _View.add_plot(self, _as_sticks(data))
+        if getattr(self, '_prop_levelofdetail', 'off') == 'on':
+            self.plots[-1]._set_lod(True)
+
+    def _set_levelofdetail(self, inp):
+        """Switch level of detail rendering on or off for all plots."""
+        self._prop_levelofdetail = inp[0]
+        for plot in self.plots:
+            plot._set_lod(inp[0] == 'on')
+
+class MultiStickView(StickView):
+    """Stick View class with several panels stacked vertically.
+
+    Every data file is drawn in every panel, e.g to show the full range of a
+    linelist above a zoomed band. The panels share one Data object per file, so
+    adding a file to several panels does not copy its sticks, and each panel
+    has its own x range and level of detail. Axes commands act on the panel
+    selected with '--panel', plot commands on the plot in every panel.
+    """
+    # Plot artists are spread over several axes, so changes are always redrawn
+    _blitArgs = []
+    def __init__(self, fig):
+        """Add the first panel to the provided figure and set the view mode to
+        'multistick'. The stick arguments are those of StickView, with the
+        additional arguments defined below.
+        """
+        StickView.__init__(self, fig)
+        self.mode = 'multistick'
+        self.panels = [self.ax]
+        self._panel = 0 #index of the selected panel
+        self._panelProps = [{}] #axes '_prop_' attributes of the unselected panels
+        # Panel arguments
+        self._add_arg('-np', '--panels', nargs=1, type=int, metavar='int',
+            help="number of panels, stacked from top to bottom")
+        self._add_arg('-p', '--panel', nargs=1, type=int, metavar='int',
+            help="panel that axes commands act on, counting from 1 at the top")
+
+    @property
+    def nPanels(self):
+        return len(self.panels)
+
+    class Plot:
+        """The Plot object for the MultiStickView class, made of one StickView
+        Plot per panel all sharing the same Data object. Plot commands are
+        passed on to the Plot in every panel.
+        """
+        def __init__(self, data, panels):
+            self._Data = data
+            self._panelPlots = []
+            for ax in panels:
+                self._add_panel(ax)
+
+        def _add_panel(self, ax):
+            """Add the data to a new panel, with the same plot properties as the
+            existing panels."""
+            panelPlot = StickView.Plot(self._Data, ax)
+            if self._panelPlots:
+                first = self._panelPlots[0]
+                for name, value in vars(first).items():
+                    if name.startswith('_prop_') and name != '_prop_linecolour':
+                        getattr(panelPlot, '_set_' + name[len('_prop_'):])(value)
+                panelPlot._prop_linecolour = first._prop_linecolour
+                plt.setp(panelPlot._plot, color=first._plot.get_color())
+            self._panelPlots.append(panelPlot)
+
+        def _data_changed(self, rows):
+            for panelPlot in self._panelPlots:
+                panelPlot._data_changed(rows)
+
+        def __getattr__(self, name):
+            """Pass '_set_' methods on to the Plot in every panel, and read other
+            attributes, e.g '_prop_' values, from the first panel."""
+            if name == '_panelPlots':
+                raise AttributeError(name)
+            if name.startswith('_set_'):
+                def _set(inp):
+                    for panelPlot in self._panelPlots:
+                        getattr(panelPlot, name)(inp)
+                return _set
+            return getattr(self._panelPlots[0], name)
+
+    def add_plot(self, data):
+        """Add a Plot for the Data object to every panel."""
+        self.plots.append(self.Plot(_as_sticks(data), self.panels))
+        self.livePlots = self.plots
+        for panel, ax in enumerate(self.panels):
+            if self._lod_on(panel):
+                self.plots[-1]._panelPlots[panel]._set_lod(True)
+
+    def _axes_args(self):
+        """Names of the arguments with a value for each panel."""
+        return [argName for argName in self.argNames if hasattr(self, '_set_' + argName)
+            and argName not in ['panels', 'panel', 'figsize']]
+
+    def _lod_on(self, panel):
+        """True if level of detail rendering is on in the panel."""
+        props = vars(self) if panel == self._panel else self._panelProps[panel]
+        return props.get('_prop_levelofdetail', 'off') == 'on'
+
+    def _set_panel(self, inp):
+        """Select the panel that axes commands act on. The '_prop_' attributes
+        of the axes arguments are swapped for those of the selected panel."""
+        panel = int(inp[0]) - 1
+        if not 0 <= panel < self.nPanels:
+            print("Panel not defined, there are {} panels.".format(self.nPanels))
+            return
+        current = self._panelProps[self._panel]
+        for argName in self._axes_args():
+            if hasattr(self, '_prop_' + argName):
+                current['_prop_' + argName] = getattr(self, '_prop_' + argName)
+                delattr(self, '_prop_' + argName)
+        for name, value in self._panelProps[panel].items():
+            setattr(self, name, value)
+        self._panelProps[panel] = {}
+        self._panel = panel
+        self.ax = self.panels[panel]
+        plt.sca(self.ax) #legends go on the selected panel
+    def _set_panels(self, inp):
+        """Set the number of panels. New panels show every data file, and
+        removing panels removes the panels at the bottom."""
+        nPanels = int(inp[0])
+        if nPanels < 1:
+            print("There must be at least one panel.")
+            return
+        self._prop_panels = nPanels
+        if self._panel >= nPanels:
+            self._set_panel([1])
+        for ax in self.panels[nPanels:]:
+            ax.remove()
+        for plot in self.plots:
+            del plot._panelPlots[nPanels:]
+        del self.panels[nPanels:], self._panelProps[nPanels:]
+        grid = self.fig.add_gridspec(nPanels, 1)
+        for panel, ax in enumerate(self.panels):
+            ax.set_subplotspec(grid[panel])
+            ax.set_position(grid[panel].get_position(self.fig))
+        for panel in range(len(self.panels), nPanels):
+            ax = self.fig.add_subplot(grid[panel])
+            self.panels.append(ax)
+            self._panelProps.append({})
+            for plot in self.plots:
+                plot._add_panel(ax)
+        plt.sca(self.ax)
+
+    def _set_levelofdetail(self, inp):
+        """Switch level of detail rendering on or off in the selected panel."""
+        self._prop_levelofdetail = inp[0]
+        for plot in self.plots:
+            plot._panelPlots[self._panel]._set_lod(inp[0] == 'on')
+
 class linelistComparisonView(_View):
+    _addsInteractively = True #asks for the linelist to compare to
+    _blitArgs = [] #linecolour replaces the density mesh
     def __init__(self, fig):
         _View.__init__(self, figure=fig, mode='resids')
         self.ax = fig.add_subplot(111)
@@ -388,62 +906,119 @@ class linelistComparisonView(_View):
             help="marker sizes for plots in figure (any valid matplotlib style, e.g '-', '--', 'none')")
         self._add_arg('-l', '--label', nargs='+', type=str,   metavar='str',
             help="labels for plots in figure legend, use '#' for spaces")
+        self._add_arg('-co', '--compareon', nargs='+', type=str, metavar='str',
+            help="quantity to compare lines on, 'A' (ratio of Einstein coefficients) or 'nu' (difference of wavenumbers)")
+        # Axes arguments
+        self._add_arg('-den', '--density', nargs=1, type=str, metavar='str',
+            help="'on' to draw many matched lines as a 2D histogram, 'off' to draw every line as a point")
     
     class Plot(_View.Plot):
+        # Comparison quantities, computed from the matched rows of each linelist
+        _comparisons = {
+            'A': lambda prim, sec: prim('einstein_A')/sec('einstein_A'),
+            'nu': lambda prim, sec: prim('wavenumber') - sec('wavenumber')
+        }
+        _aliases = {'A': 'A', 'einstein': 'A', 'nu': 'nu', 'wavenumber': 'nu'}
+
         def __init__(self, data, ax):
             _View.Plot.__init__(self, data, ax) #store data and ax locally as self.data & self.ax
             
             # Ask for second linelist file to compare to
             secFile       = input('Linelist file to compare to: ')
-            fType         = detect_filetype(secFile)
-            self._secData = fType(secFile).read_file()
+            self._secData = read_data(secFile)
             
-            # Convert data to pandas dataframe for easy merging
+            # Typed columns of each linelist, joined once through a packed-key
+            # index that is cached for the file pair
             mergers = [
                 'rotational_final', 'rotational_initial', 
                 'vibrational_final', 'vibrational_initial'
                 ] #column headers to merge on
-            self._dfPrim = pd.DataFrame(
-                data=self._Data.dat, columns=self._Data.cols
-                ).astype(self._Data.typedict)
-            self._dfSec = pd.DataFrame(
-                data=self._secData.dat, columns=self._secData.cols
-                ).astype(self._secData.typedict)
-            self._dfPrim.insert(0, 'line_number', 
-                np.arange(1, self._dfPrim.shape[0]+1)
-                ) #add column with index of line in original file
-            self._dfSec.insert(0, 'line_number', 
-                np.arange(1, self._dfSec.shape[0]+1)
-                )
-            # Merge on shortest linelist to minimise surplus lines
-            short = 'right' if self._dfSec.shape[0] < self._dfPrim.shape[0] else 'left'
-            self.dfComp = self._dfPrim.merge(self._dfSec, on=mergers, how=short)
+            self._dfPrim = _typed_frame(self._Data)
+            self._dfSec = _typed_frame(self._secData)
+            self._primIdx, self._secIdx = _cached_join(
+                self._Data.fName, self._dfPrim, secFile, self._dfSec, mergers)
+            self._compared = {} #memoised comparison quantities
             # Print merge details
             print("{0} has {1} entries; {2} has {3}. Matched {4} entries"
                 .format(
                 self._Data.fName, self._dfPrim.shape[0], secFile, 
-                self._dfSec.shape[0], self.dfComp.shape[0]
+                self._dfSec.shape[0], len(self._primIdx)
                 ))
             self._set_compareon(
                 input("Merged, select quantity to compare on: ")
             )
+            self._density = False
+            self._mesh = None
+            self._connect_view()
+            self.ax.callbacks.connect('ylim_changed', self._update_view)
+
+        def _comparison(self, name):
+            """Comparison quantity of the matched lines, computed on first use.
+            The name 'x' gives the final state energies used as x values."""
+            if name not in self._compared:
+                prim = lambda column: self._dfPrim[column].to_numpy()[self._primIdx]
+                sec = lambda column: self._dfSec[column].to_numpy()[self._secIdx]
+                if name == 'x':
+                    self._compared[name] = prim('energy_final_cm')
+                else:
+                    self._compared[name] = self._comparisons[name](prim, sec)
+            return self._compared[name]
         
         def _set_compareon(self, inp):
             """Select quantity to compare lines on."""
+            if inp not in self._aliases:
+                print("Comparison not recognised.")
+                return
+            self._prop_compareon = inp
+            xVals = self._comparison('x')
+            yVals = self._comparison(self._aliases[inp])
             if hasattr(self, '_plot'):
-                self._plot.remove()
-            if inp in ['A', 'einstein']:
-                #pd.set_option('display.max_rows', 50000, 'display.max_columns', 100, 'display.width', 1000)
-                #fOut = open('garbage.txt', 'w')
-                #print(self.dfComp, file=fOut)
-                yVals = self.dfComp['einstein_A_x']/self.dfComp['einstein_A_y']
-            elif inp in ['nu', 'wavenumber']:
-                yVals = self.dfComp['wavenumber_x'] - self.dfComp['wavenumber_y']
+                self._plot.set_data(xVals, yVals)
+                self._update_view()
             else:
-                print("Comparison not recognised.")
-            xVals = self.dfComp['energy_final_cm_x']
-            self._plot, = plt.plot(xVals, yVals, ls='none')
+                self._plot, = plt.plot(xVals, yVals, ls='none')
 
+        # Fewer matched lines in view than this are drawn as points
+        _densityMinPoints = 10000
+        # Width and height of the density bins in screen pixels
+        _binPixels = 4
+        def _update_view(self, *args):
+            """In density mode, bin the matched lines in view into a 2D histogram
+            on a grid of screen-sized bins and draw it as a single mesh, called
+            whenever the axes limits or figure size change. With few lines in
+            view, or density mode off, the lines are drawn as points."""
+            if self._mesh is not None:
+                self._mesh.remove()
+                self._mesh = None
+            x, y = self._plot.get_data()
+            if self._density:
+                (xmin, xmax), (ymin, ymax) = sorted(self.ax.get_xlim()), sorted(self.ax.get_ylim())
+                inView = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+            if not self._density or inView.sum() < self._densityMinPoints:
+                self._plot.set_visible(True)
+                return
+            self._plot.set_visible(False)
+            bbox = self.ax.get_window_extent()
+            xEdges = _bin_edges(self.ax, xmin, xmax, max(int(bbox.width)//self._binPixels, 1))
+            nY = max(int(bbox.height)//self._binPixels, 1)
+            if self.ax.get_yscale() == 'log' and ymin > 0:
+                yEdges = np.geomspace(ymin, ymax, nY + 1)
+            else:
+                yEdges = np.linspace(ymin, ymax, nY + 1)
+            counts, _, _ = np.histogram2d(x[inView], y[inView], bins=[xEdges, yEdges])
+            counts = np.ma.masked_equal(counts.T, 0) #empty bins are transparent
+            cmap = matplotlib.colors.LinearSegmentedColormap.from_list('density', [
+                matplotlib.colors.to_rgba(self._plot.get_color(), 0.2),
+                matplotlib.colors.to_rgba(self._plot.get_color(), 1.0)])
+            X, Y = np.meshgrid(xEdges, yEdges)
+            self._mesh = matplotlib.collections.QuadMesh(np.stack([X, Y], axis=-1),
+                cmap=cmap, norm=matplotlib.colors.LogNorm(vmin=1, vmax=max(counts.max(), 2)))
+            self._mesh.set_array(counts)
+            self.ax.add_collection(self._mesh, autolim=False)
+        def _set_density(self, on):
+            """Switch density rendering on or off."""
+            self._density = on
+            self._update_view()
         def _set_linecolour(self, inp):
             """Set line colour of plot."""
             try:
@@ -454,6 +1029,8 @@ class linelistComparisonView(_View):
                 pass
             self._prop_linecolour = inp
             plt.setp(self._plot, color=inp)
+            if self._mesh is not None:
+                self._update_view() #recolour the density mesh
         def _set_marker(self, inp):
             """Set marker style of plot."""
             if inp == 'none':
@@ -466,4 +1043,204 @@ class linelistComparisonView(_View):
             inp = float(inp)
             plt.setp(self._plot, ms=inp)
 
+    def add_plot(self, data):
+        _View.add_plot(self, data)
+        if getattr(self, '_prop_density', 'off') == 'on':
+            self.plots[-1]._set_density(True)
+
+    def _set_density(self, inp):
+        """Switch density rendering on or off for all plots."""
+        self._prop_density = inp[0]
+        for plot in self.plots:
+            plot._set_density(inp[0] == 'on')
+
+
+
+class BroadenedView(_View):
+    """View class for stick spectra broadened with a line profile.
+
+    The sticks of each data file are convolved with a Gaussian or pseudo-Voigt
+    profile of adjustable width, which makes it easier to compare a linelist
+    with a measured spectrum. The broadened spectrum is only evaluated over
+    the x range in view at screen resolution, so zooming and changing the
+    width stay interactive for large linelists.
+    """
+    def __init__(self, fig):
+        """Add axes to the provided figure and set the view mode to 'broadened'.
+        The available arguments for the user in view mode are defined below, and
+        each has a '_set_<argument>' method further down that is called when the
+        argument is parsed.
+        """
+        _View.__init__(self, figure=fig, mode='broadened')
+        self.ax = fig.add_subplot(111)
+        self._slider = None
+        # Line arguments
+        self._add_arg('-lw', '--linewidth',  nargs='+', type=float, metavar='float',
+            help="Width of plot line.")
+        self._add_arg('-lc', '--linecolour', nargs='+', type=str,   metavar='str',
+            help="line colours for plots in figure (any valid matplotlib colour, e.g 'red', 'blue')")
+        self._add_arg('-ls', '--linestyle',  nargs='+', type=str,   metavar='str',
+            help="line styles for plots in figure (any valid matplotlib style, e.g '-', '--', 'none')")
+        self._add_arg('-l',  '--label',      nargs='+', type=str,   metavar='str',
+            help="labels for plots in figure legend, use '#' for spaces")
+        # Axes arguments
+        self._add_arg('-pr', '--profile', nargs=1, type=str, metavar='str',
+            help="line profile, 'gauss' or 'voigt'")
+        self._add_arg('-hw', '--hwhm', nargs=1, type=float, metavar='float',
+            help="half width at half maximum of the line profile, in x units")
+        self._add_arg('-lf', '--lorentz', nargs=1, type=float, metavar='float',
+            help="Lorentzian fraction of the 'voigt' profile, between 0 and 1")
+        self._add_arg('-sl', '--slider', nargs=1, type=str, metavar='str',
+            help="'on' to show a slider for the line width below the axes, 'off' to remove it")
+
+    # View Plot objects
+    class Plot(_View.Plot):
+        """The Plot object for the BroadenedView class. Called by cmdPrompt to
+        initialise a plot object in the current View instance for a new data file.
+        """
+        # Number of broadened spectra kept per plot
+        _cacheSize = 32
+        def __init__(self, data, ax):
+            """Add a line for the broadened sticks of the Data object to the
+            provided axes. The spectrum itself is calculated by _update_view.
+
+            Arguments specified in the parent View instance's __init__ method
+            that act on plots have their '_set_' methods defined here. Every
+            '_set_' method should first store the input value in the relevant
+            '_prop_' attribute to allow the configuration to be written to file.
+            """
+            _View.Plot.__init__(self, data, ax)
+            sticks = self._Data.sort().dat
+            self._x, self._y = sticks[:, 1, 0], sticks[:, 1, 1]
+            self._plot, = ax.plot([], [])
+            self._profile = (1.0, 0.0) #hwhm, Lorentzian fraction
+            self._cache = OrderedDict() #(view, profile) -> (grid, spectrum)
+            self._connect_view()
+        # View methods
+        def _update_view(self, *args):
+            """Broaden the sticks over the x range in view at one point per
+            pixel, called whenever the x limits, figure size or profile change.
+            The most recently used spectra are cached, so returning to an
+            earlier view or width is immediate."""
+            xmin, xmax = sorted(self.ax.get_xlim())
+            nPix = max(_pixel_width(self.ax), 2)
+            key = (xmin, xmax, nPix) + self._profile
+            if key in self._cache:
+                self._cache.move_to_end(key)
+            else:
+                self._cache[key] = _broaden(self._x, self._y, xmin, xmax, nPix, *self._profile)
+                if len(self._cache) > self._cacheSize:
+                    self._cache.popitem(last=False)
+            self._plot.set_data(*self._cache[key])
+            if self.ax.get_autoscaley_on():
+                self.ax.relim()
+                self.ax.autoscale_view(scalex=False)
+        def _data_changed(self, rows):
+            """Broaden again after new sticks have been added to the Data object."""
+            self._x, self._y = self._Data.dat[:, 1, 0], self._Data.dat[:, 1, 1]
+            self._cache.clear()
+            if self.ax.get_autoscalex_on() and len(self._x): #x range not set yet
+                pad = 0.02*(self._x[-1] - self._x[0]) + 5*self._profile[0]
+                self.ax.set_xlim(self._x[0] - pad, self._x[-1] + pad, auto=None)
+            self._update_view()
+        def _set_line_profile(self, hwhm, lorentz):
+            """Set the width and Lorentzian fraction of the line profile."""
+            self._profile = (hwhm, lorentz)
+            self._update_view()
+        # Line methods
+        def _set_linewidth(self, inp):
+            """Set line width of plot."""
+            self._prop_linewidth = inp
+            inp = float(inp)
+            plt.setp(self._plot, linewidth=inp)
+        def _set_linecolour(self, inp):
+            """Set line colour of plot."""
+            try:
+                inp = tuple(float(i) for i in inp.split(','))
+            except:
+                pass
+            self._prop_linecolour = inp
+            plt.setp(self._plot, color=inp)
+        def _set_linestyle(self, inp):
+            """Set line style of plot."""
+            self._prop_linestyle = inp
+            plt.setp(self._plot, ls=inp)
+        def _set_label(self, inp):
+            """Set legend labels of plot."""
+            self._prop_label = inp
+            if inp == 'none': #line has no label
+                plt.setp(self._plot, label='__nolegend__')
+            else:
+                inp = inp.replace('#', ' ')
+                plt.setp(self._plot, label=inp)
+            plt.legend()
+
+    def add_plot(self, data):
+        _View.add_plot(self, _as_sticks(data))
+        self.plots[-1]._set_line_profile(*self._line_profile())
+        if not len(self.plots[-1]._x) or not self.ax.get_autoscalex_on(): #keep a set x range
+            return
+        xmin = min(plot._x[0] for plot in self.plots if len(plot._x))
+        xmax = max(plot._x[-1] for plot in self.plots if len(plot._x))
+        pad = 0.02*(xmax - xmin) + 5*self._line_profile()[0] #room for the wings of the end lines
+        self.ax.set_xlim(xmin - pad, xmax + pad, auto=None)
+
+    def _line_profile(self):
+        """The hwhm and Lorentzian fraction set by the profile arguments."""
+        hwhm = float(getattr(self, '_prop_hwhm', 1.0))
+        if getattr(self, '_prop_profile', 'gauss') == 'gauss':
+            return hwhm, 0.0
+        return hwhm, float(getattr(self, '_prop_lorentz', 0.5))
+
+    def _update_profile(self):
+        """Broaden all plots with the current line profile."""
+        for plot in self.plots:
+            plot._set_line_profile(*self._line_profile())
 
+    def _set_profile(self, inp):
+        """Set the line profile, 'gauss' or 'voigt' (pseudo-Voigt)."""
+        if inp[0] not in ['gauss', 'voigt']:
+            print("Profile not recognised.")
+            return
+        self._prop_profile = inp[0]
+        self._update_profile()
+    def _set_hwhm(self, inp):
+        """Set the half width at half maximum of the line profile."""
+        if not inp[0] > 0:
+            print("The hwhm must be positive.")
+            return
+        self._prop_hwhm = inp[0]
+        self._update_profile()
+        if self._slider is not None: #recentre the slider on the new width
+            self._set_slider(['on'])
+    def _set_lorentz(self, inp):
+        """Set the Lorentzian fraction of the 'voigt' profile."""
+        if not 0 <= inp[0] <= 1:
+            print("The Lorentzian fraction must be between 0 and 1.")
+            return
+        self._prop_lorentz = inp[0]
+        self._update_profile()
+    def _set_slider(self, inp):
+        """Show or remove a slider below the axes for the profile width, on a
+        log scale from 1/100 to 100 times the current width."""
+        self._prop_slider = inp[0]
+        if self._slider is not None:
+            self._slider.ax.remove()
+            self._slider = None
+            self.fig.subplots_adjust(bottom=0.11)
+        if inp[0] == 'on':
+            import matplotlib.widgets
+            self.fig.subplots_adjust(bottom=0.2)
+            hwhm = self._line_profile()[0]
+            sliderAx = self.fig.add_axes([0.2, 0.04, 0.6, 0.03])
+            self._slider = matplotlib.widgets.Slider(sliderAx, 'hwhm',
+                np.log10(hwhm) - 2, np.log10(hwhm) + 2, valinit=np.log10(hwhm))
+            self._slider.valtext.set_text('{:.3g}'.format(hwhm))
+            self._slider.on_changed(self._slide_hwhm)
+            plt.sca(self.ax) #new plots still go on the main axes
+    def _slide_hwhm(self, val):
+        """Slider callback, set the width from the log10 slider value."""
+        self._prop_hwhm = float('{:.3g}'.format(10**val))
+        self._slider.valtext.set_text('{:.3g}'.format(self._prop_hwhm))
+        self._update_profile()
+        self.fig.canvas.draw_idle()
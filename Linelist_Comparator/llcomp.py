@@ -1,5 +1,181 @@
 import pandas as pd
 import numpy  as np
+import os
+import time
+import json
+import atexit
+import tracemalloc
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import resource #not available on Windows
+except ImportError:
+    resource = None
+
+
+class Profiler:
+    """Collects wall time, row counts and memory use for each stage of the
+    llcomp entry points. Stages are recorded while the profiler is active, see
+    ``profile()``, or for the whole session if the ``LLCOMP_PROFILE``
+    environment variable is set.
+
+    The peak resident set size of each stage is measured by resetting the
+    process peak at the start of the stage, which is only possible on Linux;
+    elsewhere ``peak_rss_mb`` is None.
+    """
+    def __init__(self, memory=True):
+        self.memory = memory #track python allocations with tracemalloc
+        self.records = []
+        self._stack = []
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Record a single stage. Yields the record dictionary so the caller can
+        set the number of rows produced by the stage."""
+        record = {
+            "entry": self._stack[0]["stage"] if self._stack else name,
+            "stage": name,
+            "depth": len(self._stack),
+            "rows": None,
+            "_peak": 0,
+            "_peak_rss": 0
+        }
+        if self.memory and tracemalloc.is_tracing():
+            if self._stack: #keep parent peak before resetting for this stage
+                parent = self._stack[-1]
+                parent["_peak"] = max(parent["_peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        if self._stack: #likewise for the resident set size
+            parent = self._stack[-1]
+            parent["_peak_rss"] = max(parent["_peak_rss"], peak_rss_mb() or 0)
+        rss_reset = _reset_peak_rss()
+        self._stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["start"] = start - self._origin
+            record["wall_time"] = time.perf_counter() - start
+            peak = record.pop("_peak")
+            if self.memory and tracemalloc.is_tracing():
+                record["peak_alloc_mb"] = max(peak, tracemalloc.get_traced_memory()[1])/2**20
+            else:
+                record["peak_alloc_mb"] = None
+            peak_rss = record.pop("_peak_rss")
+            record["peak_rss_mb"] = max(peak_rss, peak_rss_mb()) if rss_reset else None
+            self._stack.pop()
+            self.records.append(record)
+
+    def table(self):
+        """Return the recorded stages as a dataframe, in order of starting time."""
+        columns = ["entry", "stage", "depth", "wall_time", "rows",
+            "peak_rss_mb", "peak_alloc_mb", "start"]
+        df = pd.DataFrame(self.records, columns=columns)
+        return df.sort_values("start").reset_index(drop=True)
+
+    def write_chrome_trace(self, fname):
+        """Write the recorded stages as Chrome trace events, which can be viewed
+        in chrome://tracing or Perfetto.
+        arguments
+            fname : str
+                Name of the '.json' file to write.
+        """
+        events = [{
+            "name": record["stage"],
+            "cat": record["entry"],
+            "ph": "X", #complete event
+            "ts": record["start"]*1e6, #microseconds
+            "dur": record["wall_time"]*1e6,
+            "pid": os.getpid(),
+            "tid": 0,
+            "args": {key: record[key] for key in ["rows", "peak_rss_mb", "peak_alloc_mb"]}
+        } for record in self.records]
+        with open(fname, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+_profiler = None #active Profiler, or None if instrumentation is off
+
+def peak_rss_mb():
+    """Peak resident set size of the process in MB since it was last reset by
+    _reset_peak_rss(), or since the process started, or None if unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])/2**10 #kB
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/2**10 if os.uname().sysname != "Darwin" else peak/2**20 #kB on Linux
+
+def _reset_peak_rss():
+    """Reset the peak resident set size to the current size, so the peak of
+    each profiled stage can be measured. Only possible on Linux, returns False
+    if the peak could not be reset."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+@contextmanager
+def profile(memory=True):
+    """Context manager that switches on instrumentation of llcomp entry points.
+    arguments
+        memory : bool
+            If True, also record peak python allocations with tracemalloc. This
+            slows down allocation heavy stages.
+    returns
+        Profiler
+            The profiler holding the stage records, e.g
+
+            with llcomp.profile() as prof:
+                linelist = llcomp.exomol_to_linelist("x.states", "x.trans")
+            print(prof.table())
+            prof.write_chrome_trace("trace.json")
+    """
+    global _profiler
+    previous = _profiler
+    _profiler = Profiler(memory=memory)
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        yield _profiler
+    finally:
+        if started:
+            tracemalloc.stop()
+        _profiler = previous
+
+@contextmanager
+def _stage(name):
+    """Internal wrapper recording a stage if instrumentation is switched on."""
+    if _profiler is None:
+        yield {}
+    else:
+        with _profiler.stage(name) as record:
+            yield record
+
+def _profile_from_environment():
+    """Switch on instrumentation for the session if LLCOMP_PROFILE is set. If
+    the value ends in '.json' a Chrome trace is written there at exit, otherwise
+    the table of stages is printed."""
+    global _profiler
+    setting = os.environ.get("LLCOMP_PROFILE", "")
+    if setting in ["", "0"]:
+        return
+    prof = _profiler = Profiler(memory=False)
+    if setting.endswith(".json"):
+        atexit.register(lambda: prof.write_chrome_trace(setting))
+    else:
+        atexit.register(lambda: print(prof.table().to_string()))
+
+_profile_from_environment()
 
 
 def y_as_fx(dataframe, x=None, y=None):
@@ -195,9 +371,40 @@ class LinelistObject:
             #if (right_value not in self.dataframe.columns) and type(right_value) is str:
             #    self.dataframe = self.dataframe[self.dataframe[left_value]==right_value]
             #else:
-            self.dataframe = self.dataframe.query(left_value+condition+right_value)
+            with _stage("filter_data") as record:
+                self.dataframe = self._query(left_value+condition+right_value)
+                record["rows"] = len(self.dataframe)
             return
 
+    def _query(self, expression):
+        """Internal method returning the rows of the dataframe for which the
+        expression is true."""
+        return self.dataframe.query(expression)
+
+    def evaluate(self, expression):
+        """Evaluate a derived column expression on the linelist data, e.g
+        'energy_f - energy_i', using native Pandas eval().
+        returns
+            Series
+                The derived column, indexed as the linelist dataframe.
+        """
+        return self.dataframe.eval(expression)
+
+    def group_reduce(self, by, column, how="sum"):
+        """Reduce a column over groups of rows.
+        arguments
+            by : string or list of strings
+                The column name(s) to group on.
+            column : string
+                The column to reduce.
+            how : string
+                One of 'sum', 'count', 'min', 'max' or 'mean'.
+        returns
+            Series
+                The reduced value of each group, indexed by group.
+        """
+        return self.dataframe.groupby(by)[column].agg(how)
+
     def _argument_reader(self, *args):
         """Internal method for supporting lazy arguments in linelist diff and 
         ratio methods."""
@@ -331,6 +538,194 @@ class Linelist(LinelistObject):
     state_suffixes = ['_f', '_i'] #possible suffixes for state data
     transition_suffixes = [] #possible suffixes for transition data
 
+class _SharedFrame:
+    """Internal copy of a dataframe in shared memory. Numeric columns are held
+    in shared memory blocks that worker processes attach to by name; other
+    columns (e.g strings) are sent to the workers with each shard."""
+    def __init__(self, df):
+        self.length = len(df)
+        self.columns = list(df.columns)
+        self.blocks = []
+        self.shared = [] #(column, block name, dtype)
+        self.objects = {}
+        for column in self.columns:
+            values = df[column].to_numpy()
+            if values.dtype.kind in "biuf":
+                block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+                np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+                self.blocks.append(block)
+                self.shared.append((column, block.name, values.dtype.str))
+            else:
+                self.objects[column] = values
+
+    def shard(self, rows):
+        """Description of the rows, a slice or an array of row positions, that
+        can be sent to a worker."""
+        return (self.length, self.columns, self.shared,
+            {column: values[rows] for column, values in self.objects.items()},
+            rows)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _run_shard(shard, operation, argument):
+    """Worker function applying a sharded operation to one shard of rows."""
+    length, columns, shared, objects, rows = shard
+    blocks = [shared_memory.SharedMemory(name=name) for _, name, _ in shared]
+    try:
+        data = dict(objects)
+        for (column, _, dtype), block in zip(shared, blocks):
+            data[column] = np.ndarray((length,), dtype=dtype, buffer=block.buf)[rows]
+        df = pd.DataFrame({column: data[column] for column in columns})
+        if operation == "query":
+            result = df.eval(argument).to_numpy(dtype=bool)
+        elif operation == "evaluate":
+            result = df.eval(argument).to_numpy().copy()
+        elif operation == "group_reduce":
+            by, column, how = argument
+            grouped = df.groupby(by)[column]
+            if how == "mean": #combined from partial sums and counts
+                result = pd.DataFrame({"sum": grouped.sum(), "count": grouped.count()})
+            else:
+                result = grouped.agg(how)
+        else:
+            raise ValueError("Sharded operation '{}' not recognised.".format(operation))
+        del df, data #release views of the shared blocks before closing them
+    finally:
+        for block in blocks:
+            block.close()
+    return result
+
+class ShardedLinelist(Linelist):
+    """Single linelist object whose filters, derived columns and group
+    reductions are run in parallel over partitions of the rows.
+
+    The numeric columns are placed in shared memory once, when first needed,
+    and kept until the linelist is closed. Filtered dataframes are described
+    to the workers by their row positions in the shared copy, so only a
+    dataframe that was not derived from it by filter_data(), e.g after
+    sort_data(), is shared again. The rows are split into contiguous shards
+    and each shard is processed in a pool of worker processes. Filters and
+    derived columns give identical results to the single-threaded
+    ``Linelist``, as do 'count', 'min' and 'max' reductions; 'sum' and 'mean'
+    may differ in the last bits due to the order of addition. Other
+    reductions are run in the main process.
+    """
+    sharded_reductions = ["sum", "count", "min", "max", "mean"] #combinable from shard results
+
+    def __init__(self, df, n_workers=None, min_shard_rows=100000):
+        super().__init__(df)
+        self.n_workers = n_workers or os.cpu_count()
+        self.min_shard_rows = min_shard_rows #smaller shards are not worth the overhead
+        self._executor = None
+        self._frame = None #shared copy of the data
+        self._rows = {} #id(dataframe) : (dataframe, row positions in self._frame)
+
+    @classmethod
+    def from_linelist(cls, linelist, **kwargs):
+        """Create a sharded linelist from the current data of a Linelist."""
+        return cls(linelist.dataframe, **kwargs)
+
+    def close(self):
+        """Shut down the worker processes and free the shared memory."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._frame is not None:
+            self._frame.close()
+            self._frame = None
+        self._rows = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _shared_rows(self):
+        """Internal method returning the row positions of the current dataframe
+        in the shared copy, sharing the dataframe first if it was not derived
+        from the shared copy."""
+        df = self.dataframe
+        kept = (self.dataframe, self.dataframe_previous, self.dataframe_persistent)
+        self._rows = {key: value for key, value in self._rows.items()
+            if any(value[0] is keep for keep in kept)} #forget replaced dataframes
+        if id(df) in self._rows and list(df.columns) == self._frame.columns:
+            return self._rows[id(df)][1]
+        if self._frame is not None:
+            self._frame.close()
+        with _stage("share") as record:
+            self._frame = _SharedFrame(df)
+            record["rows"] = len(df)
+        rows = np.arange(len(df))
+        self._rows = {id(df): (df, rows)}
+        return rows
+
+    def _map(self, operation, argument):
+        """Internal method running an operation over all shards, returning the
+        list of results in row order, or None if the data is too small to
+        shard."""
+        length = len(self.dataframe)
+        n_shards = min(self.n_workers, length//self.min_shard_rows)
+        if n_shards < 2:
+            return None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.n_workers)
+        rows = self._shared_rows()
+        bounds = np.linspace(0, length, n_shards + 1).astype(int)
+        if length == self._frame.length: #all rows in order, sent as slices
+            shards = [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+        else:
+            shards = [rows[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+        with _stage("shard " + operation) as record:
+            results = list(self._executor.map(_run_shard,
+                [self._frame.shard(shard) for shard in shards],
+                [operation]*n_shards, [argument]*n_shards))
+            record["rows"] = length
+        return results
+
+    def _query(self, expression):
+        results = self._map("query", expression)
+        if results is None:
+            return super()._query(expression)
+        mask = np.concatenate(results)
+        df = self.dataframe[mask]
+        self._rows[id(df)] = (df, self._rows[id(self.dataframe)][1][mask])
+        return df
+
+    def evaluate(self, expression):
+        results = self._map("evaluate", expression)
+        if results is None:
+            return super().evaluate(expression)
+        return pd.Series(np.concatenate(results), index=self.dataframe.index)
+
+    def group_reduce(self, by, column, how="sum"):
+        if how not in self.sharded_reductions:
+            return super().group_reduce(by, column, how)
+        results = self._map("group_reduce", (by, column, how))
+        if results is None:
+            return super().group_reduce(by, column, how)
+        partial = pd.concat(results)
+        level = list(range(partial.index.nlevels))
+        if how == "mean":
+            totals = partial.groupby(level=level).sum()
+            reduced = totals["sum"]/totals["count"]
+        else:
+            combine = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}[how]
+            reduced = partial.groupby(level=level).agg(combine)
+        reduced.index.names = partial.index.names
+        reduced.name = column
+        return reduced
+
 class MergedLinelist(LinelistObject):
     """Merged linelist object for storing two line-by-line matched linelists."""
     state_suffixes = ['_f_L', '_i_L', '_f_R', '_i_R'] #possible suffixes for state data
@@ -340,9 +735,118 @@ class MergedLinelist(LinelistObject):
             "angmom_total_f", "angmom_total_i",
             "vibrational_f", "vibrational_i",
             "electronic_state_f", "electronic_state_i"]):
-        merged_df = compare_dataframes(leftLinelist, rightLinelist, merge_on)
+        self.merge_on = list(merge_on)
+        left_df = leftLinelist.dataframe
+        right_df = rightLinelist.dataframe
+        with _stage("MergedLinelist") as record:
+            # Keep the row positions of each merged line so the join can be reused
+            merged_df = compare_dataframes(
+                left_df.assign(_row_L=np.arange(len(left_df))),
+                right_df.assign(_row_R=np.arange(len(right_df))),
+                self.merge_on
+            )
+            self._rows_L = merged_df.pop("_row_L").to_numpy()
+            self._rows_R = merged_df.pop("_row_R").to_numpy()
+            record["rows"] = len(merged_df)
+        self._right_length = len(right_df)
+        # Name of each right linelist value column in the merged dataframe
+        self._right_columns = {
+            column: column+"_R" if column in left_df.columns else column
+            for column in right_df.columns if column not in self.merge_on
+        }
         super().__init__(merged_df)
 
+    def update_right(self, rightLinelist, check_keys=True):
+        """Refresh the right linelist values from an updated linelist, e.g the
+        calculated linelist from the next iteration of a fit, reusing the join
+        from initialisation instead of merging again.
+
+        The updated linelist must have the same rows in the same order as the
+        original right linelist, only the values of the non-key columns may
+        change. Filters and sorting already applied to the merged linelist are
+        kept, and diff() and ratio() use the new values.
+        arguments
+            rightLinelist : Linelist
+                The updated right linelist.
+            check_keys : bool
+                If True, check that the merge columns are unchanged.
+        returns
+            MergedLinelist
+                The updated merged linelist (self).
+        """
+        right_df = rightLinelist.dataframe
+        if len(right_df) != self._right_length:
+            raise ValueError("Updated linelist has {} rows, expected {}. Create a new MergedLinelist."
+                .format(len(right_df), self._right_length))
+        with _stage("update_right") as record:
+            if check_keys:
+                for key in self.merge_on:
+                    new = right_df[key].to_numpy()[self._rows_R]
+                    old = self.dataframe_persistent[key].to_numpy()
+                    if not ((new == old) | (pd.isna(new) & pd.isna(old))).all(): #merge matches NaN keys
+                        raise ValueError("Merge column '{}' has changed. Create a new MergedLinelist."
+                            .format(key))
+            values = {column: right_df[column].to_numpy() for column in self._right_columns}
+            refreshed = []
+            for df in [self.dataframe_persistent, self.dataframe_previous, self.dataframe]:
+                if any(df is _ for _ in refreshed): #attributes may share a dataframe
+                    continue
+                rows = self._rows_R[df.index.to_numpy()] #merged index labels are positions
+                with pd.option_context("mode.chained_assignment", None):
+                    for column, merged_column in self._right_columns.items():
+                        df[merged_column] = values[column][rows]
+                refreshed.append(df)
+            record["rows"] = len(self.dataframe)
+        return self
+
+def _exomol_trans_types():
+    """Internal method returning the recognised ExoMol '.trans' columns."""
+    """
+    @todo Convert to merge operator '|' at python 3.9
+    """
+    return {
+        **Linelist.transition_data_types,
+        "state_number_final": int,   #exomol trans files have two 'stateID' columns
+        "state_number_initial": int
+    }
+
+def _read_exomol_states(states_file):
+    """Internal method reading an ExoMol '.states' file to a dataframe."""
+    exomol_states_types = Linelist.state_data_types
+    with _stage("detect_file_headers"):
+        states_columns, _ = detect_file_headers(states_file, [_ for _ in exomol_states_types])
+    with _stage("read_csv states") as record:
+        states_df = pd.read_csv(states_file,
+            delim_whitespace=True,
+            index_col=False,
+            header=0, #0-th row as headers
+            skip_blank_lines=True,
+            usecols=[column[1] for column in states_columns],
+            dtype={column[0] : exomol_states_types[column[0]] for column in states_columns}
+        )
+        record["rows"] = len(states_df)
+    return states_df
+
+def _read_exomol_trans(trans_file, chunksize=None):
+    """Internal method reading an ExoMol '.trans' file to a dataframe, or to an
+    iterator over dataframes of chunksize rows if chunksize is given."""
+    exomol_trans_types = _exomol_trans_types()
+    with _stage("detect_file_headers"):
+        trans_columns, _ = detect_file_headers(trans_file, [_ for _ in exomol_trans_types])
+    with _stage("read_csv trans") as record:
+        trans_df = pd.read_csv(trans_file,
+            delim_whitespace=True,
+            index_col=False,
+            header=0, #0-th row as headers
+            skip_blank_lines=True,
+            usecols=[column[1] for column in trans_columns],
+            dtype={column[0] : exomol_trans_types[column[0]] for column in trans_columns},
+            chunksize=chunksize
+        )
+        if chunksize is None:
+            record["rows"] = len(trans_df)
+    return trans_df
+
 def exomol_to_linelist(states_file=None, trans_file=None):
     """Convert ExoMol states and trans file to Linelist object.
     arguments
@@ -353,47 +857,193 @@ def exomol_to_linelist(states_file=None, trans_file=None):
     returns
         Linelist
             A Linelist object."""
-    exomol_states_types = Linelist.state_data_types
+    with _stage("exomol_to_linelist") as entry:
+        states_df = _read_exomol_states(states_file)
+        trans_df = _read_exomol_trans(trans_file)
+        # Match final state in trans file to stateID in states file
+        with _stage("merge final states") as record:
+            linelist_df_ = trans_df.merge(states_df, 
+                left_on="state_number_final",
+                right_on="state_number",
+                how="inner"
+            )
+            record["rows"] = len(linelist_df_)
+        # Match initial state in trans file to stateID in state file
+        with _stage("merge initial states") as record:
+            linelist_df = linelist_df_.merge(states_df,
+                left_on="state_number_initial",
+                right_on="state_number",
+                suffixes=("_f", "_i"),
+                how="inner"
+            )
+            record["rows"] = len(linelist_df)
+        entry["rows"] = len(linelist_df)
+    return Linelist(linelist_df)
+
+def _dense_by_state(states_df, column, fill=np.nan):
+    """Internal method returning a state column as a dense array indexed by
+    state ID, so that values for a transition are a single fancy index."""
+    ids = states_df["state_number"].to_numpy()
+    dense = np.full(ids.max() + 1, fill, dtype=float)
+    dense[ids] = states_df[column].to_numpy()
+    return dense
+
+def check_exomol_integrity(states_file, trans_file, chunksize=10**6,
+        wavenumber_tolerance=1e-4, max_examples=100, verbose=True):
+    """Check an ExoMol states and trans file pair for problems that the merges
+    in ``exomol_to_linelist`` silently drop or ignore. The '.trans' file is
+    streamed in chunks, with each check vectorised over the chunk, so the run
+    time is linear in the number of transitions.
+
+    The following are checked
+        duplicate_states : state IDs appearing more than once in '.states'.
+        dangling_states : state IDs referenced in '.trans' but not in '.states'.
+        duplicate_transitions : (final, initial) pairs appearing more than once.
+        bad_degeneracy : states whose degeneracy is not a positive multiple of
+            2J+1.
+        bad_angmom : transitions with |J_f - J_i| > 1, or J_f = J_i = 0.
+        energy_mismatch : transitions whose wavenumber differs from E_f - E_i
+            by more than the tolerance, or with E_f <= E_i if the '.trans' file
+            has no wavenumber column.
+    arguments
+        states_file : str
+            Path to Exomol '.states' file.
+        trans_file : str
+            Path to Exomol '.trans' file.
+        chunksize : int
+            Number of transitions read at once.
+        wavenumber_tolerance : float
+            Largest allowed difference between the wavenumber and E_f - E_i.
+        max_examples : int
+            Largest number of offending transitions kept for each check.
+        verbose : bool
+            If True, print a summary of the checks.
+    returns
+        counts : dict
+            Number of problems found by each check.
+        examples : dict
+            The offending state IDs for state checks, and a dataframe of up to
+            max_examples offending transitions for transition checks.
     """
-    @todo Convert to merge operator '|' at python 3.9
+    with _stage("check_exomol_integrity") as entry:
+        states_df = _read_exomol_states(states_file)
+        ids = states_df["state_number"].to_numpy()
+        max_id = ids.max()
+        sorted_ids = np.unique(ids) #for membership tests
+        id_counts = np.bincount(ids, minlength=max_id + 1)
+        counts, examples = {}, {}
+        examples["duplicate_states"] = np.flatnonzero(id_counts > 1)
+        counts["duplicate_states"] = len(examples["duplicate_states"])
+        if {"degeneracy", "angmom_total"} <= set(states_df.columns):
+            g = states_df["degeneracy"].to_numpy()
+            multiplicity = (2*states_df["angmom_total"].to_numpy() + 1).round().astype(int)
+            bad = (g <= 0) | (g % multiplicity != 0)
+            examples["bad_degeneracy"] = ids[bad]
+            counts["bad_degeneracy"] = int(bad.sum())
+        has_angmom = "angmom_total" in states_df.columns
+        angmom = _dense_by_state(states_df, "angmom_total") if has_angmom else None
+        energy = _dense_by_state(states_df, "energy") if "energy" in states_df.columns else None
+        # Streamed transition checks
+        dangling = []
+        pair_keys = []
+        transition_checks = ["duplicate_transitions", "bad_angmom", "energy_mismatch"]
+        found = {check: [] for check in transition_checks}
+        for check in transition_checks:
+            counts[check] = 0
+        rows = 0
+        for chunk in _read_exomol_trans(trans_file, chunksize=chunksize):
+            with _stage("check chunk") as record:
+                final = chunk["state_number_final"].to_numpy()
+                initial = chunk["state_number_initial"].to_numpy()
+                known = np.ones(len(chunk), dtype=bool)
+                for ref in [final, initial]:
+                    position = np.searchsorted(sorted_ids, ref).clip(max=len(sorted_ids) - 1)
+                    is_state = sorted_ids[position] == ref
+                    dangling.append(np.unique(ref[~is_state]))
+                    known &= is_state
+                final, initial = final[known], initial[known]
+                kept = chunk[known]
+                pair_keys.append(final.astype(np.int64)*(max_id + 1) + initial)
+                if has_angmom:
+                    j_f, j_i = angmom[final], angmom[initial]
+                    bad = (np.abs(j_f - j_i) > 1) | ((j_f == 0) & (j_i == 0))
+                    counts["bad_angmom"] += int(bad.sum())
+                    found["bad_angmom"].append(kept[bad].head(max_examples))
+                if energy is not None:
+                    energy_difference = energy[final] - energy[initial]
+                    if "transition_wavenumber" in chunk.columns:
+                        wavenumber = kept["transition_wavenumber"].to_numpy()
+                        bad = np.abs(wavenumber - energy_difference) > wavenumber_tolerance
+                    else:
+                        bad = energy_difference <= 0
+                    counts["energy_mismatch"] += int(bad.sum())
+                    found["energy_mismatch"].append(
+                        kept[bad].head(max_examples).assign(energy_difference=energy_difference[bad][:max_examples]))
+                rows += len(chunk)
+                record["rows"] = len(chunk)
+        # Duplicate transitions by hashing packed (final, initial) keys
+        with _stage("duplicate transitions"):
+            pair_keys = pd.Series(np.concatenate(pair_keys)) if pair_keys else pd.Series([], dtype=np.int64)
+            duplicated = pair_keys[pair_keys.duplicated()].to_numpy()
+            counts["duplicate_transitions"] = len(duplicated)
+            found["duplicate_transitions"].append(pd.DataFrame({
+                "state_number_final": duplicated[:max_examples]//(max_id + 1),
+                "state_number_initial": duplicated[:max_examples]%(max_id + 1)
+            }))
+        examples["dangling_states"] = np.unique(np.concatenate(dangling)) if dangling else np.array([], dtype=int)
+        counts["dangling_states"] = len(examples["dangling_states"])
+        for check in transition_checks:
+            if found[check]:
+                examples[check] = pd.concat(found[check], ignore_index=True).head(max_examples)
+        entry["rows"] = rows
+    if verbose:
+        print("Checked {} states and {} transitions.".format(len(states_df), rows))
+        for check in counts:
+            print("    {:<24}{}".format(check, counts[check]))
+    return counts, examples
+
+def compute_lifetimes(states_file, trans_file, chunksize=10**6, compare=True):
+    """Compute radiative lifetimes from an ExoMol states and trans file pair
+    without loading the full linelist. The '.trans' file is streamed in chunks
+    and the Einstein A coefficients are summed for each final (upper) state
+    into a dense array indexed by state ID, which is inverted to give
+    lifetimes. States with no decay have an infinite lifetime.
+    arguments
+        states_file : str
+            Path to Exomol '.states' file.
+        trans_file : str
+            Path to Exomol '.trans' file.
+        chunksize : int
+            Number of transitions read at once.
+        compare : bool
+            If True and the '.states' file has a lifetime column, add it to the
+            output along with the ratio of the computed to file lifetime.
+    returns
+        DataFrame
+            The 'state_number' and computed 'lifetime' of each state, and if
+            compared, the 'lifetime_file' and 'lifetime_ratio'.
     """
-    exomol_trans_types  = {
-        **Linelist.transition_data_types,
-        "state_number_final": int,   #exomol trans files have two 'stateID' columns
-        "state_number_initial": int
-    }
-    states_columns, _ = detect_file_headers(states_file, [_ for _ in exomol_states_types])
-    trans_columns, _ = detect_file_headers(trans_file, [_ for _ in exomol_trans_types])
-    states_df = pd.read_csv(states_file,
-        delim_whitespace=True,
-        index_col=False,
-        header=0, #0-th row as headers
-        skip_blank_lines=True,
-        usecols=[column[1] for column in states_columns],
-        dtype={column[0] : exomol_states_types[column[0]] for column in states_columns}
-    )
-    trans_df = pd.read_csv(trans_file,
-        delim_whitespace=True,
-        index_col=False,
-        header=0, #0-th row as headers
-        skip_blank_lines=True,
-        usecols=[column[1] for column in trans_columns],
-        dtype={column[0] : exomol_trans_types[column[0]] for column in trans_columns}
-    )
-    # Match final state in trans file to stateID in states file
-    linelist_df_ = trans_df.merge(states_df, 
-        left_on="state_number_final",
-        right_on="state_number",
-        how="inner"
-    )
-    # Match initial state in trans file to stateID in state file
-    linelist_df = linelist_df_.merge(states_df,
-        left_on="state_number_initial",
-        right_on="state_number",
-        suffixes=("_f", "_i"),
-        how="inner"
-    )
-    return Linelist(linelist_df)
+    with _stage("compute_lifetimes") as entry:
+        states_df = _read_exomol_states(states_file)
+        ids = states_df["state_number"].to_numpy()
+        n_ids = ids.max() + 1
+        total_A = np.zeros(n_ids)
+        for chunk in _read_exomol_trans(trans_file, chunksize=chunksize):
+            with _stage("accumulate chunk") as record:
+                total_A += np.bincount(chunk["state_number_final"].to_numpy(),
+                    weights=chunk["einstein_coefficient"].to_numpy(),
+                    minlength=n_ids
+                )[:n_ids] #states missing from the '.states' file are ignored
+                record["rows"] = len(chunk)
+        with np.errstate(divide="ignore"):
+            lifetime = 1/total_A[ids]
+        lifetimes_df = pd.DataFrame({"state_number": ids, "lifetime": lifetime})
+        if compare and "lifetime" in states_df.columns:
+            lifetimes_df["lifetime_file"] = states_df["lifetime"].to_numpy()
+            with np.errstate(divide="ignore", invalid="ignore"):
+                lifetimes_df["lifetime_ratio"] = lifetime/lifetimes_df["lifetime_file"]
+        entry["rows"] = len(lifetimes_df)
+    return lifetimes_df
 
 def file_to_linelist(linelist_file):
     """Convert space delimited file to Linelist object.
@@ -413,16 +1063,21 @@ def file_to_linelist(linelist_file):
         **{key+"_i": Linelist.state_data_types[key] for key in Linelist.state_data_types},
         **Linelist.transition_data_types
     }
-    use_columns, _ = detect_file_headers(linelist_file, [_ for _ in file_column_types])
-    linelist_df = pd.read_csv(linelist_file,
-        delim_whitespace=True,
-        index_col=False,
-        header=0, #0-th row as headers
-        skip_blank_lines=True,
-        usecols=[column[1] for column in use_columns],
-        dtype={column[0] : file_column_types[column[0]] for column in use_columns}
-    )
-    
+    with _stage("file_to_linelist") as entry:
+        with _stage("detect_file_headers"):
+            use_columns, _ = detect_file_headers(linelist_file, [_ for _ in file_column_types])
+        with _stage("read_csv") as record:
+            linelist_df = pd.read_csv(linelist_file,
+                delim_whitespace=True,
+                index_col=False,
+                header=0, #0-th row as headers
+                skip_blank_lines=True,
+                usecols=[column[1] for column in use_columns],
+                dtype={column[0] : file_column_types[column[0]] for column in use_columns}
+            )
+            record["rows"] = len(linelist_df)
+        entry["rows"] = len(linelist_df)
+
     return Linelist(linelist_df)
 
 def hitran_to_linelist(linelist_file):
@@ -456,32 +1111,37 @@ def hitran_to_linelist(linelist_file):
         "upper_degeneracy": float,
         "lower_degeneracy": float
     }
-    linelist_df = pd.read_fwf(linelist_file,
-        widths=[2,1,12,10,10,5,5,10,4,8,15,15,15,15,6,12,1,7,7], #Hitran 2004 '.par'
-        header=None,
-        names=[_ for _ in header_dict],
-        dtype=header_dict
-    )
-    extract_hitran_global_quanta(linelist_df, 2) #global state quanta from format class 2
-    extract_hitran_local_quanta(linelist_df, 5)  #local state quanta from class 5
-    linelist_df["energy_f"] = linelist_df["energy_i"] + linelist_df["transition_wavenumber"]
-    linelist_df = linelist_df.drop(columns=[
-        "molecule_number",
-        "isotope_number",
-        "air-broadened_width",
-        "self-broadened_width",
-        "temperature_dependence",
-        "pressure_shift",
-        "upper_state_global",
-        "lower_state_global",
-        "upper_state_local",
-        "lower_state_local",
-        "error_code",
-        "reference_code",
-        "line_mixing",
-        "branch_electronic",
-        "branch_total"
-    ])
+    with _stage("hitran_to_linelist") as entry:
+        with _stage("read_fwf") as record:
+            linelist_df = pd.read_fwf(linelist_file,
+                widths=[2,1,12,10,10,5,5,10,4,8,15,15,15,15,6,12,1,7,7], #Hitran 2004 '.par'
+                header=None,
+                names=[_ for _ in header_dict],
+                dtype=header_dict
+            )
+            record["rows"] = len(linelist_df)
+        with _stage("extract quanta"):
+            extract_hitran_global_quanta(linelist_df, 2) #global state quanta from format class 2
+            extract_hitran_local_quanta(linelist_df, 5)  #local state quanta from class 5
+        linelist_df["energy_f"] = linelist_df["energy_i"] + linelist_df["transition_wavenumber"]
+        linelist_df = linelist_df.drop(columns=[
+            "molecule_number",
+            "isotope_number",
+            "air-broadened_width",
+            "self-broadened_width",
+            "temperature_dependence",
+            "pressure_shift",
+            "upper_state_global",
+            "lower_state_global",
+            "upper_state_local",
+            "lower_state_local",
+            "error_code",
+            "reference_code",
+            "line_mixing",
+            "branch_electronic",
+            "branch_total"
+        ])
+        entry["rows"] = len(linelist_df)
     return Linelist(linelist_df)
 
 def extract_hitran_global_quanta(hitran_dataframe, molecule_class):